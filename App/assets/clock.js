@@ -0,0 +1,15 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    clock: {
+        // Render "<Weekday> <hh:mm AM/PM>" in the location's timezone, followed by the weather status
+        update: function(n_intervals, weather) {
+            const timeZone = (weather && weather.timezone) || 'America/New_York';
+            const status = (weather && weather.status) || '';
+            const now = new Date();
+
+            const weekday = now.toLocaleDateString('en-US', {timeZone: timeZone, weekday: 'long'});
+            const time = now.toLocaleTimeString('en-US', {timeZone: timeZone, hour: '2-digit', minute: '2-digit', hour12: true});
+
+            return `${weekday} ${time}\n\n${status}`;
+        }
+    }
+});
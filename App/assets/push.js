@@ -0,0 +1,27 @@
+// Subscribe to server-pushed data updates; data-interval polling stays on as a fallback
+// until the event stream is connected, and resumes whenever it drops.
+(function() {
+    if (!window.EventSource) {
+        return;
+    }
+
+    function setProps(id, props) {
+        if (window.dash_clientside && window.dash_clientside.set_props) {
+            window.dash_clientside.set_props(id, props);
+        }
+    }
+
+    const source = new EventSource('/events');
+
+    source.onopen = function() {
+        setProps('data-interval', {disabled: true});
+    };
+
+    source.onerror = function() {
+        setProps('data-interval', {disabled: false});
+    };
+
+    source.addEventListener('update', function(event) {
+        setProps('push-version', {data: event.data});
+    });
+})();
@@ -0,0 +1,283 @@
+import threading
+import time
+
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background pool for revalidating stale entries, shared by every cache
+REVALIDATOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-revalidate')
+
+'''
+Bookkeeping for a single in-flight call shared by concurrent callers.
+'''
+class _Call():
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+'''
+Coalesces concurrent calls for the same key into a single execution.
+
+The first caller for a key runs the function; callers arriving while it is in flight
+wait for it and share its result (or its exception).
+'''
+class SingleFlight():
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.value
+
+        try:
+            call.value = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.event.set()
+
+        return call.value
+
+'''
+Thread-safe, size-bounded cache whose entries expire after a fixed time-to-live.
+
+Least recently used entries are evicted once maxsize is reached. When a SharedCache is given,
+misses are also looked up in (and fills written to) that cross-process tier under namespace.
+
+When scale is given, lifetimes are ttl times scale() at the time each entry is stored, so
+callers can lengthen them under load. Expired entries are kept for a further stale seconds. Within that window get_or_fetch serves
+the last known value immediately and revalidates it in the background, so readers neither
+wait on upstream nor fail while it is slow or down.
+'''
+class TTLCache():
+
+    # Seconds a process may hold the shared lease on a key while fetching it
+    LEASE_TTL = 15
+
+    def __init__(self, ttl, maxsize=256, shared=None, namespace=None, stale=0, scale=None):
+        self.ttl = ttl
+        self.scale = scale
+        self.maxsize = maxsize
+        self.shared = shared
+        self.namespace = namespace
+        self.stale = stale
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._revalidating = set()
+        # Lookups by result ('hit', 'stale' or 'miss'), for monitoring
+        self.stats = Counter()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    '''Return the lifetime given to entries stored now'''
+    def lifetime(self):
+        return self.ttl * self.scale() if self.scale is not None else self.ttl
+
+    '''Return the cached value for key, or default if missing or expired'''
+    def get(self, key, default=None):
+        value, fresh = self.lookup(key, default)
+
+        return value if fresh else default
+
+    '''Return (value, fresh) for key, where value may be stale; (default, False) if missing'''
+    def lookup(self, key, default=None):
+        value, result = self._lookup(key, default)
+        self.stats[result] += 1
+
+        return value, result == 'hit'
+
+    def _lookup(self, key, default):
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None:
+                return default, 'miss'
+
+            value, expires = entry
+            now = time.monotonic()
+
+            if expires + self.stale <= now:
+                del self._data[key]
+                return default, 'miss'
+
+            self._data.move_to_end(key)
+
+            return value, 'hit' if expires > now else 'stale'
+
+    '''Store value under key for ttl seconds (default self.lifetime()), evicting the least recently used entry if full'''
+    def set(self, key, value, ttl=None):
+        ttl = self.lifetime() if ttl is None else ttl
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    '''Return the cached value for key, calling fetch() to fill it on a miss
+
+    Concurrent misses for the same key wait on a single call to fetch() and share its result;
+    a stale value is returned at once while fetch() runs in the background
+    '''
+    def get_or_fetch(self, key, fetch):
+        sentinel = object()
+        value, fresh = self.lookup(key, sentinel)
+
+        if fresh:
+            return value
+
+        if value is not sentinel:
+            self.revalidate(key, fetch)
+            return value
+
+        return self._flight.do(key, lambda: self._fill(key, fetch))
+
+    def _fill(self, key, fetch):
+        # Another caller may have filled the entry while this one was waiting
+        sentinel = object()
+        value, result = self._lookup(key, sentinel)
+
+        if result == 'hit':
+            return value
+
+        if self.shared is not None:
+            return self._fill_shared(key, fetch)
+
+        value = fetch()
+        self.set(key, value)
+
+        return value
+
+    '''Refill key with fetch() in the background, keeping the current value if that fails'''
+    def revalidate(self, key, fetch):
+        with self._lock:
+            if key in self._revalidating:
+                return
+
+            self._revalidating.add(key)
+
+        def run():
+            try:
+                self._flight.do(key, lambda: self._fill(key, fetch))
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        REVALIDATOR.submit(run)
+
+    '''Fill a key from the shared tier, or fetch it while holding the shared lease
+
+    Processes that find the lease taken poll the shared tier for the holder's result, and fetch
+    it themselves only if the lease outlives LEASE_TTL.
+    '''
+    def _fill_shared(self, key, fetch):
+        deadline = time.monotonic() + self.LEASE_TTL
+
+        while True:
+            entry = self.shared.get(self.namespace, key)
+
+            if entry is not None:
+                value, remaining = entry
+                self.set(key, value, min(self.lifetime(), remaining))
+                return value
+
+            held = self.shared.acquire(self.namespace, key, self.LEASE_TTL)
+
+            if held or time.monotonic() > deadline:
+                break
+
+            time.sleep(0.05)
+
+        try:
+            value = fetch()
+            self.shared.set(self.namespace, key, value, self.lifetime())
+        finally:
+            if held:
+                self.shared.release(self.namespace, key)
+
+        self.set(key, value)
+
+        return value
+
+    '''Return the seconds before key expires, or 0 if it is missing or expired'''
+    def remaining(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+
+            return max(0, entry[1] - time.monotonic()) if entry is not None else 0
+
+    '''Fetch key again if its entry is missing or expires within ahead seconds
+
+    Used by background prefetching so readers keep hitting a warm entry. With a shared tier, an
+    entry another process has already refreshed is adopted, and a key whose lease is taken is
+    left to the process holding it. Runs under the same single flight as get_or_fetch, so fill()
+    returns the entry's value for readers that missed while it was in flight.
+    '''
+    def refresh(self, key, fetch, ahead):
+        sentinel = object()
+
+        def fill():
+            if self.remaining(key) > ahead:
+                return self._lookup(key, None)[0]
+
+            held = False
+
+            if self.shared is not None:
+                entry = self.shared.get(self.namespace, key)
+
+                if entry is not None and entry[1] > ahead:
+                    value, remaining = entry
+                    self.set(key, value, min(self.lifetime(), remaining))
+                    return value
+
+                held = self.shared.acquire(self.namespace, key, self.LEASE_TTL)
+
+                # Keep the current value, or wait for the holder's result as a reader would
+                if not held:
+                    value, result = self._lookup(key, sentinel)
+                    return value if result != 'miss' else self._fill_shared(key, fetch)
+
+            try:
+                value = fetch()
+
+                if self.shared is not None:
+                    self.shared.set(self.namespace, key, value, self.lifetime())
+            finally:
+                if held:
+                    self.shared.release(self.namespace, key)
+
+            self.set(key, value)
+
+            return value
+
+        self._flight.do(key, fill)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
\ No newline at end of file
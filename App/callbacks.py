@@ -1,39 +1,35 @@
-from matplotlib.font_manager import json_dump
-from weather_map import WeatherMap
+from weather_map import MAP_ZOOM, WeatherMap, parse_bounds
 from constants import get_constants
 from forecast_plotter import ForecastPlotter
+from geolocation import Geolocator
+from prefetch import SCHEDULER
 
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from dash.exceptions import PreventUpdate
 from flask import request
-from urllib.request import urlopen
 
 from app import app
 
-import json
 import dash
+import metrics
 
-import dash_leaflet as dl
+STATES, DAYTON, OWM_KEY, IP_KEY, MGR = get_constants()
 
-STATES_DF, DAYTON, OWM_KEY, IP_KEY, MGR = get_constants()
+GEO = Geolocator(IP_KEY)
 
 '''Store location JSON data in Store object'''
 @app.callback(
     Output(component_id='memory-output', component_property='data'),
     Input(component_id='url', component_property='pathname')
 )
+@metrics.timed_callback
 def update_location(pathname):
-    ip = request.remote_addr
-
-    url = f'http://ipinfo.io/{ip}?token={IP_KEY}'
-    response = urlopen(url)
-    data = json.load(response)
-
-    return data
+    return GEO.locate(request.remote_addr)
 
 '''Updates page data
 
-Interval object used to update the time/temperature/status data every minute
+Runs on page load, location or map changes, on pushed updates and on the fallback data interval;
+pushes and interval ticks are dropped unless the cached upstream data has changed. The clock is advanced client-side (assets/clock.js).
 '''
 @app.callback(
     [
@@ -41,121 +37,142 @@ Interval object used to update the time/temperature/status data every minute
         Output(component_id='temp', component_property='children'),
         Output(component_id='status', component_property='children'),
         Output(component_id='location', component_property='children'),
-        Output(component_id='date-time-status', component_property='children'),
+        Output(component_id='weather-status', component_property='data'),
         Output(component_id='temperature-forecast', component_property='figure'),
         Output(component_id='precipitation-forecast', component_property='figure'),
         Output(component_id='humidity-forecast', component_property='figure'),
         Output(component_id='map', component_property='children'),
-        Output(component_id='map', component_property='center')
+        Output(component_id='map', component_property='center'),
+        Output(component_id='map-layers-key', component_property='data'),
+        Output(component_id='data-version', component_property='data'),
+        Output(component_id='figure-keys', component_property='data')
     ],
     
     [
         Input(component_id='url', component_property='pathname'),
-        Input(component_id='minute-interval', component_property='n_intervals'),
+        Input(component_id='data-interval', component_property='n_intervals'),
+        Input(component_id='push-version', component_property='data'),
         Input(component_id='memory-output', component_property='data'),
         Input(component_id='map', component_property='bounds')
     ],
+    [
+        State(component_id='map-layers-key', component_property='data'),
+        State(component_id='data-version', component_property='data'),
+        State(component_id='figure-keys', component_property='data')
+    ],
     prevent_initial_callback=False
 )
-def refresh_page(pathname, n_intervals, location, bounds_json):
+@metrics.timed_callback
+def refresh_page(pathname, n_intervals, push_version, location, bounds_json, layers_key, version, figure_keys):
     log = f'Refresh called. ({n_intervals})'
-    manager, weather, city, state, country, timezone_name, lat, lon, time, weekday = MGR.initialize_weather(location, STATES_DF)
-    wtr = MGR.get_weather_fmt(weather)
-    forecast = MGR.get_forecast(manager, city, state, country, timezone_name)
-    forecast_plotter = ForecastPlotter(forecast)
+    SCHEDULER.touch(location)
+
+    with metrics.timer('callback_phase_seconds', callback='refresh_page', phase='bundle'):
+        bundle = MGR.get_bundle(location, STATES)
+
+    # Check which input triggered the callback
+    context = dash.callback_context
+    input_id = context.triggered[0]['prop_id'].split('.')[0] if context.triggered else None
 
-    icon = weather.weather_icon_url(size='4x')
+    if input_id in ('data-interval', 'push-version') and bundle['version'] == version:
+        raise PreventUpdate
+
+    wtr = bundle['weather_fmt']
+    forecast_plotter = ForecastPlotter(bundle['forecast'])
+
+    icon = bundle['weather']['icon_url']
 
     temp = f'## {wtr["temperature"]}'
 
     status = f'Precipitation: {wtr["precipitation"]}\n\nHumidity: {wtr["humidity"]}%\n\nWind: {wtr["wind"]}'
     
-    location = f'##### {city}, {state}'
+    location = f'##### {bundle["city"]}, {bundle["state"]}'
     
-    date_time_status = f'{weekday} {time}\n\n{wtr["status"]}'
+    weather_status = dict(status=wtr['status'], timezone=bundle['timezone'])
 
-    temp_fig = forecast_plotter.plot_temp_forecast()
-    precip_fig = forecast_plotter.plot_precip_forecast()
-    humid_fig = forecast_plotter.plot_humid_forecast()
+    # Send only the changed data of each figure, and nothing for figures whose data is unchanged
+    figure_keys = figure_keys or {}
 
-    center = (lat, lon)
+    with metrics.timer('callback_phase_seconds', callback='refresh_page', phase='figures'):
+        new_figure_keys = {kind: forecast_plotter.fingerprint(kind) for kind in ('temp', 'precip', 'humid')}
+        temp_fig, precip_fig, humid_fig = (
+            forecast_plotter.patch(kind) if new_figure_keys[kind] != figure_keys.get(kind) else dash.no_update
+            for kind in ('temp', 'precip', 'humid')
+        )
 
-    # Try to read JSON data from bounds object
-    try:
-        bounds = eval(json.dumps(bounds_json))
-        weather_map = WeatherMap(center, 11, bounds, OWM_KEY)
-        layers = weather_map.layers
-    # Null JSON object should trigger an exception
-    except:
-        layers = [dl.TileLayer()]
+    center = (bundle['lat'], bundle['lon'])
 
-    return icon, temp, status, location, date_time_status, temp_fig, precip_fig, humid_fig, layers, center
+    # Layers are memoized per quantized bounds and zoom; unchanged layers are not resent
+    with metrics.timer('callback_phase_seconds', callback='refresh_page', phase='map'):
+        weather_map = WeatherMap(center, MAP_ZOOM, parse_bounds(bounds_json))
+        layers = weather_map.layers if weather_map.key != layers_key else dash.no_update
 
-'''Update daily forecast weekday names'''
-@app.callback(
-    [
-        Output(component_id=f'weekday-{i}', component_property='children')
-        for i in range(7)
-    ],
+    return icon, temp, status, location, weather_status, temp_fig, precip_fig, humid_fig, layers, center, weather_map.key, bundle['version'], new_figure_keys
+
+'''Advance the weekday and time shown in date-time-status in the browser, using the location's timezone'''
+app.clientside_callback(
+    ClientsideFunction(namespace='clock', function_name='update'),
+    Output(component_id='date-time-status', component_property='children'),
 
     [
-        Input(component_id='minute-interval', component_property='n_intervals'),
-        Input(component_id='date-time-status', component_property='children'),
-        Input(component_id='memory-output', component_property='data')
+        Input(component_id='clock-interval', component_property='n_intervals'),
+        Input(component_id='weather-status', component_property='data')
     ]
 )
-def update_weekdays(n_intervals, datetime, location):
-    # Check which input triggered the callback
-    context = dash.callback_context
-    if context.triggered:
-        input_id = context.triggered[0]['prop_id'].split('.')[0]
 
-    loc_triggered = (input_id == 'memory-output')
+'''Store the 7-day forecast for the current location
 
-    # Only check for new daily forecasts at midnight or on page load
-    if loc_triggered or datetime.split()[1] == '12:00':
-        if loc_triggered or datetime.split()[2] == 'AM':
+Computed once per update and shared by the weekday, icon and high/low outputs below;
+left untouched when the forecast has not changed
+'''
+@app.callback(
+    Output(component_id='daily-forecast', component_property='data'),
 
-            manager, weather, city, state, country, timezone_name, lat, lon, time, weekday = MGR.initialize_weather(location, STATES_DF)
-            weekdays, daily_hi, daily_lo, daily_icon = MGR.get_daily_forecast(manager, lat, lon, timezone_name)
-            weekdays = [w[:3] for w in weekdays] # just the first three letters
+    [
+        Input(component_id='data-interval', component_property='n_intervals'),
+        Input(component_id='push-version', component_property='data'),
+        Input(component_id='memory-output', component_property='data')
+    ],
+    State(component_id='daily-forecast', component_property='data')
+)
+@metrics.timed_callback
+def update_daily_forecast(n_intervals, push_version, location, current):
+    SCHEDULER.touch(location)
+    weekdays, daily_hi, daily_lo, daily_icon = MGR.get_bundle(location, STATES)['daily']
+    daily = dict(weekdays=weekdays, hi=daily_hi, lo=daily_lo, icons=daily_icon)
 
-            return tuple(weekdays)
+    if daily == current:
+        raise PreventUpdate
 
-    raise PreventUpdate
+    return daily
 
-'''Update daily forecast weather icons'''
+'''Update daily forecast weekday names'''
 @app.callback(
     [
-        Output(component_id=f'daily-forecast-{i}', component_property='children')
+        Output(component_id=f'weekday-{i}', component_property='children')
         for i in range(7)
     ],
 
-    [
-        Input(component_id='minute-interval', component_property='n_intervals'),
-        Input(component_id='date-time-status', component_property='children'),
-        Input(component_id='memory-output', component_property='data')
-    ]
-    
+    Input(component_id='daily-forecast', component_property='data'),
+    prevent_initial_call=True
 )
-def update_daily_icons(n_intervals, datetime, location):
-    # Check which input triggered the callback
-    context = dash.callback_context
-    if context.triggered:
-        input_id = context.triggered[0]['prop_id'].split('.')[0]
+@metrics.timed_callback
+def update_weekdays(daily):
+    return tuple(w[:3] for w in daily['weekdays']) # just the first three letters
 
-    loc_triggered = (input_id == 'memory-output')
-
-    # Only check for new daily forecasts at midnight or on page load
-    if loc_triggered or datetime.split()[1] == '12:00':
-        if loc_triggered or datetime.split()[2] == 'AM':
-        
-            manager, weather, city, state, country, timezone_name, lat, lon, time, weekday = MGR.initialize_weather(location, STATES_DF)
-            weekdays, daily_hi, daily_lo, daily_icon = MGR.get_daily_forecast(manager, lat, lon, timezone_name)
+'''Update daily forecast weather icons'''
+@app.callback(
+    [
+        Output(component_id=f'daily-forecast-{i}', component_property='src')
+        for i in range(7)
+    ],
 
-            return tuple(daily_icon[i] for i in range(len(weekdays)))
-    
-    raise PreventUpdate
+    Input(component_id='daily-forecast', component_property='data'),
+    prevent_initial_call=True
+)
+@metrics.timed_callback
+def update_daily_icons(daily):
+    return tuple(daily['icons'])
 
 '''Update daily forecast high/low temperatures'''
 @app.callback(
@@ -164,72 +181,63 @@ def update_daily_icons(n_intervals, datetime, location):
         for i in range(7)
     ],
 
-    [
-        Input(component_id='minute-interval', component_property='n_intervals'),
-        Input(component_id='date-time-status', component_property='children'),
-        Input(component_id='memory-output', component_property='data')
-    ]
+    Input(component_id='daily-forecast', component_property='data'),
+    prevent_initial_call=True
 )
-def update_daily_hi_lo(n_intervals, datetime, location):
-    # Check which input triggered the callback
-    context = dash.callback_context
-    if context.triggered:
-        input_id = context.triggered[0]['prop_id'].split('.')[0]
-
-    loc_triggered = (input_id == 'memory-output')
-
-    # Only check for new daily forecasts at midnight or on page load
-    if loc_triggered or n_intervals > 0 and datetime.split()[1] == '12:00':
-        if loc_triggered or datetime.split()[2] == 'AM':
-
-            manager, weather, city, state, country, timezone_name, lat, lon, time, weekday = MGR.initialize_weather(location, STATES_DF)
-            weekdays, daily_hi, daily_lo, daily_icon = MGR.get_daily_forecast(manager, lat, lon, timezone_name)
-
-            return tuple(f'**{daily_hi[i]}\u00b0** {daily_lo[i]}' for i in range(len(weekdays)))
-    
-    raise PreventUpdate
-
+@metrics.timed_callback
+def update_daily_hi_lo(daily):
+    return tuple(f'**{hi}\u00b0** {lo}\u00b0' for hi, lo in zip(daily['hi'], daily['lo']))
+
+# Alert banner styles, with the forecast tabs moved up while the banner is shown
+ALERT_STYLE = {
+    'color':'white',
+    'background-color':'crimson',
+    'text-align':'justify',
+    'border-radius':'5px',
+    'width':'100%',
+    'display':'inline-block',
+    'padding-top':'2px',
+    'padding-bottom':'2px',
+    'padding-left':'10px',
+    'margin-right':'10px',
+}
+HIDDEN_ALERT_STYLE = {'display':'none'}
+TABS_STYLE = {'float':'bottom', 'padding-top':'100px', 'width':'100%'}
+TABS_ALERT_STYLE = {'float':'bottom', 'padding-top':'30px', 'width':'100%'}
+
+'''Show every active emergency alert for the current location
+
+Left untouched when the alert set has not changed since it was last rendered
+'''
 @app.callback(
     [
         Output(component_id='emergency-alert-div', component_property='style'),
         Output(component_id='emergency-alert', component_property='children'),
-
-        Output(component_id='tabs-div', component_property='style')
+        Output(component_id='tabs-div', component_property='style'),
+        Output(component_id='alert-key', component_property='data')
     ],
 
     [
         Input(component_id='thirty-minute-interval', component_property='n_intervals'),
+        Input(component_id='push-version', component_property='data'),
         Input(component_id='memory-output', component_property='data')
-    ]
+    ],
+    State(component_id='alert-key', component_property='data')
 )
-def update_emergency_alert(n_intervals, location):
-    manager, weather, city, state, country, timezone_name, lat, lon, time, weekday = MGR.initialize_weather(location, STATES_DF)
-
-    senders, events, starts, ends, descriptions = MGR.get_emergency_alerts(manager, lat, lon, timezone_name)
-
-    alert_style = {'display':'none'}
-    tabs_style={'float':'bottom', 'padding-top':'100px', 'width':'100%'}
-
-    message = ''
-
-    if senders:
+@metrics.timed_callback
+def update_emergency_alert(n_intervals, push_version, location, alert_key):
+    SCHEDULER.touch(location)
+    alerts = MGR.get_bundle(location, STATES)['alerts']
 
-        alert_style = {
-            'color':'white',
-            'background-color':'crimson',
-            'text-align':'justify',
-            'border-radius':'5px',
-            'width':'100%',
-            'display':'inline-block',
-            'padding-top':'2px',
-            'padding-bottom':'2px',
-            'padding-left':'10px',
-            'margin-right':'10px',
-        }
+    if alerts['key'] == alert_key:
+        raise PreventUpdate
 
-        tabs_style={'float':'bottom', 'padding-top':'30px', 'width':'100%'}
+    if not alerts['alerts']:
+        return HIDDEN_ALERT_STYLE, '', TABS_STYLE, alerts['key']
 
-        for i in range(len(senders)):
-            message = f'\n\n{senders[i]} has issued a {events[i]} in effect from {starts[i]} until {ends[i]}.\n\n{descriptions[i]}'
+    message = '\n\n---'.join(
+        f'\n\n{alert["sender"]} has issued a {alert["event"]} in effect from {alert["start"]} until {alert["end"]}.\n\n{alert["description"]}'
+        for alert in alerts['alerts']
+    )
 
-    return alert_style, message, tabs_style
\ No newline at end of file
+    return ALERT_STYLE, message, TABS_ALERT_STYLE, alerts['key']
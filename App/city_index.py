@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+
+from array import array
+
+'''
+Grid-based spatial index mapping coordinates to the nearest city in the pyowm city registry.
+
+Cities are bucketed into CELL-degree cells and stored as flat arrays sorted by cell, so a lookup
+only scans the handful of cells around the query point. Cities can also be found by name.
+'''
+class CityIndex():
+
+    # Size of a grid cell in degrees
+    CELL = 0.5
+
+    def __init__(self, cities):
+        cities = sorted(cities, key=lambda c: self.cell(c[4], c[5]))
+
+        self.ids = array('l', (c[0] for c in cities))
+        self.names = [c[1] for c in cities]
+        self.countries = [c[2] for c in cities]
+        self.states = [c[3] for c in cities]
+        self.lats = array('f', (c[4] for c in cities))
+        self.lons = array('f', (c[5] for c in cities))
+
+        # Each occupied cell maps to the [start, end) range of its cities in the arrays above
+        self.cells = {}
+        for i, c in enumerate(cities):
+            key = self.cell(c[4], c[5])
+            start, _end = self.cells.get(key, (i, i))
+            self.cells[key] = (start, i + 1)
+
+        # Case-insensitive city name and country mapped to the positions of matching cities
+        self.by_name = {}
+        for i, c in enumerate(cities):
+            self.by_name.setdefault((c[1].lower(), c[2]), []).append(i)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def cell(cls, lat, lon):
+        return math.floor(lat / cls.CELL), math.floor(lon / cls.CELL)
+
+    '''Return the nearest city to a point as (city_id, name, country, state, lat, lon)
+
+    Rings of cells around the point are searched outward until no unsearched ring can hold a
+    closer city. Returns None if no city lies within max_rings cells.
+    '''
+    def nearest(self, lat, lon, max_rings=10):
+        row, col = self.cell(lat, lon)
+        scale = math.cos(math.radians(lat)) ** 2
+
+        best, best_dist = None, math.inf
+
+        for ring in range(max_rings + 1):
+            # Every cell in this ring is at least ring - 1 whole cells away from the point
+            if ((ring - 1) * self.CELL) ** 2 * min(1, scale) > best_dist:
+                break
+
+            for key in self._ring(row, col, ring):
+                start, end = self.cells.get(key, (0, 0))
+
+                for i in range(start, end):
+                    dist = (self.lats[i] - lat) ** 2 + scale * (self.lons[i] - lon) ** 2
+
+                    if dist < best_dist:
+                        best, best_dist = i, dist
+
+        if best is None:
+            return None
+
+        return self.city(best)
+
+    '''Return the first city named name in country (and state, if given) as (city_id, name, country, state, lat, lon), or None'''
+    def find(self, name, country, state=None):
+        for i in self.by_name.get((name.lower(), country), []):
+            if state is None or self.states[i] == state:
+                return self.city(i)
+
+        return None
+
+    def city(self, i):
+        return self.ids[i], self.names[i], self.countries[i], self.states[i], self.lats[i], self.lons[i]
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+
+        for d in range(-ring, ring + 1):
+            yield row - ring, col + d
+            yield row + ring, col + d
+
+        for d in range(-ring + 1, ring):
+            yield row + d, col - ring
+            yield row + d, col + ring
+
+    '''Build an index over every city in the registry bundled with pyowm'''
+    @classmethod
+    def from_registry(cls, registry):
+        cursor = registry.connection.cursor()
+
+        try:
+            cities = cursor.execute('SELECT city_id, name, country, state, lat, lon FROM city').fetchall()
+        finally:
+            cursor.close()
+
+        return cls(cities)
+
+# Seconds before building the index is tried again after it failed
+RETRY_AFTER = 10*60
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+# (time, exception) of the last failed build
+_FAILURE = None
+
+'''Return the process-wide city index, building it from load_registry() on first use
+
+After a failed build, calls raise at once for RETRY_AFTER seconds instead of loading the registry again
+'''
+def get_city_index(load_registry):
+    global _INDEX, _FAILURE
+
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                if _FAILURE is not None and time.monotonic() - _FAILURE[0] < RETRY_AFTER:
+                    raise RuntimeError(f'city index unavailable: {_FAILURE[1]}')
+
+                try:
+                    _INDEX = CityIndex.from_registry(load_registry())
+                except Exception as e:
+                    _FAILURE = (time.monotonic(), e)
+                    raise
+
+    return _INDEX
\ No newline at end of file
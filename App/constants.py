@@ -1,13 +1,22 @@
 from forecast_manager import ForecastManager
+from functools import lru_cache
 
-import pandas as pd
+import csv
+import os
+
+STATES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'states.csv')
 
 '''
 Define constants to be used elsewhere throughout the code.
+
+Loaded once per process; later calls return the same objects.
 '''
+@lru_cache(maxsize=None)
 def get_constants():
     
-    STATES_DF = pd.read_csv('https://raw.githubusercontent.com/jasonong/List-of-US-States/master/states.csv')
+    # US state names mapped to their postal abbreviations
+    with open(STATES_PATH, newline='') as f:
+        STATES = {row['State']: row['Abbreviation'] for row in csv.DictReader(f)}
 
     DAYTON = {'city': 'Dayton', 'region': 'Ohio', 'country': 'US', 'timezone': 'America/New_York', 'loc':'39.7589,-84.1916'}
 
@@ -19,4 +28,4 @@ def get_constants():
     
     MGR = ForecastManager(DAYTON, OWM_KEY)
 
-    return STATES_DF, DAYTON, OWM_KEY, IP_KEY, MGR
\ No newline at end of file
+    return STATES, DAYTON, OWM_KEY, IP_KEY, MGR
\ No newline at end of file
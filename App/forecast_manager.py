@@ -1,24 +1,134 @@
-import pyowm
+import hashlib
+import http_client
+import json
+import metrics
 import pytz
-import requests
 
+from cache import TTLCache
+from city_index import get_city_index
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from forecast_record import ForecastRecord
+from quota import OWM_BUDGET
+from shared_cache import get_shared_cache
+
+ONECALL_PATH = '/data/2.5/onecall'
+
+'''
+Return one cache per kind of data, backed by the cross-process shared cache when one is configured.
+
+Lifetimes are stretched by scale() as the upstream call budget runs low.
+'''
+def make_caches(ttls, maxsize, stale, scale):
+    caches = {kind: TTLCache(ttl, maxsize, get_shared_cache(), kind, stale.get(kind, 0), scale) for kind, ttl in ttls.items()}
+
+    for kind, cache in caches.items():
+        metrics.register_cache(kind, cache)
+
+    return caches
 
 '''
 Class for managing forcasts, weather, and related functions.
+
+Upstream data is held in process-wide caches shared by every instance, keyed by
+resolved location, so the upstream call rate scales with the number of distinct
+locations served rather than the number of connected clients. Expired data is served
+while it is refetched in the background, so callbacks only wait on upstream for
+locations with no data at all.
 '''
 class ForecastManager():
 
+    # Seconds each kind of upstream data is reused before being fetched again
+    CACHE_TTLS = {
+        'place': 24*60*60,
+        'onecall': 5*60,
+        'alerts': 5*60,
+    }
+
+    # Seconds past expiry that data is still served, as last-known-good, while it is refetched
+    CACHE_STALE = {
+        'onecall': 60*60,
+    }
+
+    # Maximum number of distinct locations held per kind of data
+    CACHE_SIZE = 512
+
+    CACHES = make_caches(CACHE_TTLS, CACHE_SIZE, CACHE_STALE, OWM_BUDGET.stretch)
+
+    # Budget usage above which background prefetching stops, leaving the rest for page views
+    PREFETCH_MAX_USAGE = 0.8
+
+    # Bounded pool shared by every manager for fetching several locations at once
+    FETCH_WORKERS = 8
+    EXECUTOR = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='forecast-fetch')
+
     def __init__(self, location, key):
         self.location = location
         self.key = key
 
-    '''Initialize and return basic weather objects
+    '''Load the pyowm city registry
 
-    manager and weather are used to retrieve current and forecasted weather data
-    location and time data are used for data retrieval and output
+    Its in-memory SQLite connection only works on the thread that opened it, so the registry is
+    only read once, into the process-wide city index, and is not kept
     '''
-    def initialize_weather(self, location, states):
+    def city_registry(self):
+        # pyowm is only used for its bundled city database, so it is imported on first use
+        import pyowm
+
+        return pyowm.OWM(self.key).city_id_registry()
+
+    '''Return the process-wide city index, building it from the registry on first use'''
+    def city_index(self):
+        return get_city_index(self.city_registry)
+
+    '''Return a cache key for a latitude/longitude pair
+
+    Coordinates are rounded to roughly a kilometre so that clients in the same area share entries
+    '''
+    @staticmethod
+    def coords_key(lat, lon):
+        return round(lat, 2), round(lon, 2)
+
+    '''Return the One Call data for a location as a ForecastRecord
+
+    A single One Call response carries current, hourly, daily and alert data, so one upstream
+    request serves every method below until the cached entry expires
+    with ahead given, the entry is instead refreshed in place if it expires within ahead seconds
+    '''
+    def get_onecall(self, lat, lon, ahead=None):
+        lat, lon = self.coords_key(lat, lon)
+
+        def fetch_onecall():
+            response = http_client.get('owm_api', ONECALL_PATH, params={'lat': lat, 'lon': lon, 'exclude': 'minutely', 'appid': self.key}, endpoint='onecall')
+            response.raise_for_status()
+
+            return ForecastRecord.from_onecall(response.json(), hashlib.sha1(response.content).hexdigest())
+
+        # Background prefetch: refetch only if the entry is about to expire
+        if ahead is not None:
+            return self.CACHES['onecall'].refresh((lat, lon), fetch_onecall, ahead)
+
+        return self.CACHES['onecall'].get_or_fetch((lat, lon), fetch_onecall)
+
+    '''Return the registry city nearest to a point as (city_id, name, country, state, lat, lon)
+
+    Uses the spatial city index; returns None if it cannot be built or has no nearby city
+    '''
+    def nearest_city(self, lat, lon):
+        try:
+            index = self.city_index()
+        except Exception:
+            return None
+
+        return index.nearest(lat, lon)
+
+    '''Resolve an ipinfo-style location to (city, state, country, timezone_name, lat, lon)
+
+    the location is resolved to its nearest registry city, whose coordinates key the upstream request
+    so that nearby clients share one cache entry; without the city index, or a registry city to
+    match, the ipinfo city and coordinates are used as they are
+    '''
+    def resolve_location(self, location, states):
         # check if location is available, esle set default to Dayton, OH
         try:
             city, state, country, timezone_name = location['city'], location['region'], location['country'], location['timezone']
@@ -27,35 +137,119 @@ class ForecastManager():
             city, state, country, timezone_name = 'Dayton', 'Ohio', 'US', 'America/New_York'
             lat, lon = 39.7589, -84.1916
 
-        owm = pyowm.OWM(self.key)
-        manager = owm.weather_manager()
-        observation = manager.weather_at_place(f'{city}, {state}, {country}')
-        weather = observation.weather
+        try:
+            index = self.city_index()
+        # One Call only needs the coordinates ipinfo already supplied
+        except Exception:
+            return city, state, country, timezone_name, lat, lon
+
+        nearest = index.nearest(lat, lon)
+
+        if nearest:
+            city_id, city, _country, city_state, lat, lon = nearest
+            state = city_state or state
+        # Fall back to a lookup by name
+        else:
+            found = self.CACHES['place'].get_or_fetch(f'{city}, {state}, {country}', lambda: index.find(city, country, states.get(state)))
+
+            if found is not None:
+                city_id, city, _country, state, _lat, _lon = found
+
+        return city, state, country, timezone_name, lat, lon
+
+    '''Return the cache key a location resolves to, shared by every client in the same area'''
+    def location_key(self, location, states):
+        city, state, country, timezone_name, lat, lon = self.resolve_location(location, states)
 
-        reg = owm.city_id_registry()
-        state_abbr = states[states['State']==state]['Abbreviation'].values[0]
-        city_ids = reg.ids_for(city, country=country, state=state_abbr)
-        city_id, city, _country, state, _lat, _lon = city_ids[0]
+        return self.coords_key(lat, lon)
+
+    '''Refresh a location's upstream data in place if it expires within ahead seconds
+
+    Skipped while the call budget is nearly spent; the data is then refetched on demand instead
+    '''
+    def prefetch(self, location, states, ahead):
+        if OWM_BUDGET.usage() > self.PREFETCH_MAX_USAGE:
+            return
+
+        city, state, country, timezone_name, lat, lon = self.resolve_location(location, states)
+        self.get_onecall(lat, lon, ahead=ahead)
+
+    '''Initialize and return basic weather objects
+
+    onecall and weather are used to retrieve current and forecasted weather data
+    location and time data are used for data retrieval and output
+    '''
+    def initialize_weather(self, location, states):
+        city, state, country, timezone_name, lat, lon = self.resolve_location(location, states)
+
+        onecall = self.get_onecall(lat, lon)
+        weather = onecall.current
 
         timezone = pytz.timezone(timezone_name)
         time = datetime.today().astimezone(timezone).strftime('%I:%M %p')
         weekday = datetime.today().astimezone(timezone).strftime('%A')
 
-        return manager, weather, city, state, country, timezone_name, lat, lon, time, weekday
+        return onecall, weather, city, state, country, timezone_name, lat, lon, time, weekday
+
+    '''Return everything a page refresh needs for a location as one bundle
+
+    A single One Call fetch backs the current, hourly, daily and alert fields
+    version changes only when the upstream data or the local hour (which labels the forecasts) changes
+    '''
+    def get_bundle(self, location, states):
+        with metrics.timer('forecast_manager_seconds', method='initialize_weather'):
+            onecall, weather, city, state, country, timezone_name, lat, lon, time, weekday = self.initialize_weather(location, states)
+
+        hour = datetime.now().astimezone(pytz.timezone(timezone_name)).strftime('%Y%m%d%H')
+
+        with metrics.timer('forecast_manager_seconds', method='format'):
+            return dict(
+                version = f'{onecall.version}:{city}:{hour}',
+                onecall = onecall,
+                weather = weather,
+                city = city,
+                state = state,
+                country = country,
+                timezone = timezone_name,
+                lat = lat,
+                lon = lon,
+                time = time,
+                weekday = weekday,
+                weather_fmt = self.get_weather_fmt(onecall),
+                forecast = self.get_forecast(onecall, timezone_name),
+                daily = self.get_daily_forecast(onecall, timezone_name),
+                alerts = self.get_emergency_alerts(onecall, timezone_name)
+            )
+
+    '''Return bundles for several locations, fetching them concurrently on the shared pool
+
+    Wall-clock time is bounded by the slowest location rather than the sum of all of them. A
+    location that fails yields its exception in place of a bundle, so it does not hide the others
+    '''
+    def get_bundles(self, locations, states):
+        def get_bundle(location):
+            try:
+                return self.get_bundle(location, states)
+            except Exception as e:
+                return e
+
+        return list(self.EXECUTOR.map(get_bundle, locations))
 
     '''Return a dictionary of formatted weather data
 
-    For pretty printing
+    For pretty printing; today's high/low and the chance of precipitation come from the daily and hourly data
     '''
-    def get_weather_fmt(self, weather):
+    def get_weather_fmt(self, onecall):
+        weather = onecall.current
+
         weather_dict = dict(
-            temperature = f'{round(weather.temperature("fahrenheit")["temp"])} \u00b0F',
-            hi = f'{round(weather.temperature("fahrenheit")["temp_max"])} \u00b0F',
-            lo = f'{round(weather.temperature("fahrenheit")["temp_min"])} \u00b0F',
-            precipitation = f'{weather.precipitation_probability or 0}%',
-            humidity = f'{weather.humidity}',
-            wind = f'{round(weather.wind(unit="miles_hour")["speed"])} mph',
-            status = f'{weather.detailed_status.title()}'
+            temperature = f'{round(weather["temp"])} \u00b0F',
+            hi = f'{round(float(onecall.daily["temp_max"][0]))} \u00b0F',
+            lo = f'{round(float(onecall.daily["temp_min"][0]))} \u00b0F',
+            precipitation = f'{round(100*float(onecall.hourly["pop"][0]))}%',
+            humidity = f'{weather["humidity"]}',
+            wind = f'{round(weather["wind"])} mph',
+            status = f'{weather["status"].title()}'
         )
 
         return weather_dict
@@ -63,19 +257,20 @@ class ForecastManager():
     '''Return formatted times and forecasted temperatures
 
     temperatures and times used to plot forecasted temperature data
+    hourly data is sampled every three hours, with precipitation summed over each three hour window
     '''
-    def get_forecast(self, manager, city, state, country, timezone_name):
+    def get_forecast(self, onecall, timezone_name):
         timezone = pytz.timezone(timezone_name)
         now = datetime.now().astimezone(timezone)
 
         times = [now + timedelta(hours=3*i) for i in range(8)]
         times_fmt = [t.strftime('%I %p').lstrip('0') for t in times]
 
-        forecast_hourly = manager.forecast_at_place(f'{city}, {state}, {country}', '3h')
+        hours = 3*(min(24, len(onecall.hourly['temp'])) // 3)
 
-        temps = [w.temperature('fahrenheit')['temp'] for w in forecast_hourly.forecast.weathers][:8]
-        precip = [w.rain[list(w.rain.keys())[0]] if w.rain else 0 for w in forecast_hourly.forecast.weathers][:8]
-        humid = [w.humidity for w in forecast_hourly.forecast.weathers][:8]
+        temps = onecall.hourly['temp'][:hours:3]
+        precip = onecall.hourly['rain'][:hours].reshape(-1, 3).sum(axis=1)
+        humid = onecall.hourly['humidity'][:hours:3]
 
         return times_fmt, temps, precip, humid
 
@@ -83,35 +278,42 @@ class ForecastManager():
 
     Formatted times, daily high/low temperatures, and weather icons used for week-long daily forecast display
     '''
-    def get_daily_forecast(self, manager, lat, lon, timezone_name):
+    def get_daily_forecast(self, onecall, timezone_name):
         timezone = pytz.timezone(timezone_name)
         now = datetime.now().astimezone(timezone)
 
         times = [now + timedelta(days=i) for i in range(7)]
         times_fmt = [t.strftime('%A') for t in times]
 
-        forecast_daily = manager.one_call(lat, lon).forecast_daily
-        temps_hi =  [round(w.temperature('fahrenheit')['max']) for w in forecast_daily][:7]
-        temps_lo =  [round(w.temperature('fahrenheit')['min']) for w in forecast_daily][:7]
-        icons = [w.weather_icon_url(size='4x') for w in forecast_daily[:7]]
+        temps_hi = onecall.daily['temp_max'][:7].round().astype(int).tolist()
+        temps_lo = onecall.daily['temp_min'][:7].round().astype(int).tolist()
+        icons = onecall.daily['icon_url'][:7]
 
         return times_fmt, temps_hi, temps_lo, icons
 
-    def get_emergency_alerts(self, manager, lat, lon, timezone_name):
-        timezone = pytz.timezone(timezone_name)
+    '''Return the active emergency alerts as a dict of a fingerprint (key) and a list of alerts
+
+    Each alert has its sender, event, local start and end times and description; the key changes
+    only when the alert set or the timezone it is shown in does. Alert sets are cached per
+    upstream response, so they are built once for every viewer of the same area
+    '''
+    def get_emergency_alerts(self, onecall, timezone_name):
+        def build_alerts():
+            timezone = pytz.timezone(timezone_name)
 
-        response = requests.get(f'https://api.openweathermap.org/data/2.5/onecall?lat={lat}&lon={lon}&exclude=current,minutely,hourly,daily&appid={self.key}')
-        response_dict = response.json()
+            alerts = [
+                dict(
+                    sender = alert['sender_name'],
+                    event = alert['event'],
+                    start = datetime.fromtimestamp(alert['start'], timezone).strftime('%I:%M %p'),
+                    end = datetime.fromtimestamp(alert['end'], timezone).strftime('%I:%M %p'),
+                    description = alert['description']
+                )
+                for alert in onecall.alerts
+            ]
 
-        if 'alerts' in response_dict.keys():
-            alerts = response_dict['alerts']
+            key = hashlib.sha1(json.dumps([timezone_name, alerts]).encode()).hexdigest()
 
-            senders = [alert['sender_name'] for alert in alerts]
-            events = [alert['event'] for alert in alerts]
-            starts = [datetime.utcfromtimestamp(alert['start']).astimezone(timezone).strftime('%I:%M %p') for alert in alerts] # ugly
-            ends = [datetime.utcfromtimestamp(alert['end']).astimezone(timezone).strftime('%I:%M %p') for alert in alerts]
-            descriptions = [alert['description'] for alert in alerts]
+            return dict(key=key, alerts=alerts)
 
-            return senders, events, starts, ends, descriptions
-        
-        return None, None, None, None, None
\ No newline at end of file
+        return self.CACHES['alerts'].get_or_fetch((onecall.version, timezone_name), build_alerts)
\ No newline at end of file
@@ -1,115 +1,141 @@
+import hashlib
+import json
+import numpy as np
 import plotly.graph_objects as go
 
+from dash import Patch
+
+'''
+Static styling of each forecast chart: y axis title, fill colour, label precision and y axis floor.
+'''
+CHARTS = {
+    'temp': dict(title='Temperature \u00b0F', fillcolor='rgba(117,250,202,0.5)', digits=None, floor=None),
+    'precip': dict(title='Precipitation (mm)', fillcolor='rgba(85,157,218,0.5)', digits=2, floor=0),
+    'humid': dict(title='Humidity %', fillcolor='rgba(225, 204, 255, 0.5)', digits=None, floor=0),
+}
+
 '''
 Class for plotting forecasts from weather manager.
+
+Each chart's template, layout and axis configuration is built once per process as a figure
+skeleton. Full figures are the skeleton plus the forecast data; refreshes send only the data
+as a partial update (Patch) against the figure already in the browser.
 '''
 class ForecastPlotter():
 
+    _SKELETONS = {}
+
     def __init__(self, forecast):
         self.times = forecast[0]
         self.temps = forecast[1]
         self.precip = forecast[2]
         self.humid = forecast[3]
 
-    '''Return a plot of forecasted temperature data'''
-    def plot_temp_forecast(self):
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=list(range(len(self.temps))),
-            y=self.temps,
-            line_shape='spline',
-            fill='tozeroy',
-            mode='text',
-            # Display rounded temperatures above all points but the first and last
-            text=[round(self.temps[i]) if i in range(1,len(self.temps)-1) else None for i in range(len(self.temps))],
-            textfont=dict(size=14),
-            textposition='top center',
-            fillcolor='rgba(117,250,202,0.5)'
-        ))
-        fig.update_layout(
-            template='plotly_white',
-            yaxis_title='Temperature \u00b0F',
-            xaxis = dict(
-                tickvals = list(range(len(self.times))),
-                ticktext = self.times,
-            ),
-            margin = {
-                't': 50,
-                'b': 50
-            },
-            yaxis_range=(0.5*(3*min(self.temps) - max(self.temps)), 0.5*(3*max(self.temps) - min(self.temps))),
-            font = dict(size=14)
+    '''Return the cached figure skeleton for a chart, building it on first use'''
+    @classmethod
+    def skeleton(cls, kind):
+        if kind not in cls._SKELETONS:
+            chart = CHARTS[kind]
+
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                line_shape='spline',
+                fill='tozeroy',
+                mode='text',
+                textfont=dict(size=14),
+                textposition='top center',
+                fillcolor=chart['fillcolor']
+            ))
+            fig.update_layout(
+                template='plotly_white',
+                yaxis_title=chart['title'],
+                margin = {
+                    't': 50,
+                    'b': 50
+                },
+                font = dict(size=14)
+            )
+            fig.update_xaxes(fixedrange=True)
+            fig.update_yaxes(fixedrange=True)
+
+            cls._SKELETONS[kind] = fig.to_dict()
+
+        return cls._SKELETONS[kind]
+
+    def series(self, kind):
+        return np.asarray({'temp': self.temps, 'precip': self.precip, 'humid': self.humid}[kind], dtype=float)
+
+    '''Return the data-dependent properties of a chart
+
+    Rounded values are displayed above all points but the first and last
+    '''
+    def properties(self, kind):
+        chart = CHARTS[kind]
+        values = self.series(kind)
+
+        if chart['digits'] is None:
+            labels = values.round().astype(int).tolist()
+        else:
+            labels = values.round(chart['digits']).tolist()
+
+        text = [label if i in range(1,len(values)-1) else None for i, label in enumerate(labels)]
+
+        lo = 0.5*(3*values.min() - values.max())
+        hi = 0.5*(3*values.max() - values.min())
+
+        if chart['floor'] is not None:
+            lo = max(chart['floor'], lo)
+
+        return dict(
+            x = list(range(len(values))),
+            y = values.tolist(),
+            text = text,
+            tickvals = list(range(len(self.times))),
+            ticktext = list(self.times),
+            range = [float(lo), float(hi)]
         )
-        fig.update_xaxes(fixedrange=True)
-        fig.update_yaxes(fixedrange=True)
 
-        return fig
+    '''Return a stable fingerprint of a chart's data, for skipping unchanged figures'''
+    def fingerprint(self, kind):
+        data = json.dumps([list(self.times), self.series(kind).tolist()])
+        return hashlib.sha1(data.encode()).hexdigest()
 
-    '''Return a plot of forecasted self.precipitation data'''
-    def plot_precip_forecast(self):
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=list(range(len(self.precip))),
-            y=self.precip,
-            line_shape='spline',
-            fill='tozeroy',
-            mode='text',
-            # Display rounded temperatures above all points but the first and last
-            text=[round(self.precip[i], 2) if i in range(1,len(self.precip)-1) else None for i in range(len(self.precip))],
-            textfont=dict(size=14),
-            textposition='top center',
-            fillcolor='rgba(85,157,218,0.5)'
-
-        ))
-        fig.update_layout(
-            template='plotly_white',
-            yaxis_title='Precipitation (mm)',
-            xaxis = dict(
-                tickvals = list(range(len(self.times))),
-                ticktext = self.times,
-            ),
-            margin = {
-                't': 50,
-                'b': 50
-            },
-            yaxis_range=(max(0, 0.5*(3*min(self.precip) - max(self.precip))), 0.5*(3*max(self.precip) - min(self.precip))),
-            font = dict(size=14)
+    '''Return a complete figure for a chart'''
+    def plot(self, kind):
+        skeleton = self.skeleton(kind)
+        props = self.properties(kind)
+
+        trace = dict(skeleton['data'][0], x=props['x'], y=props['y'], text=props['text'])
+        layout = dict(
+            skeleton['layout'],
+            xaxis = dict(skeleton['layout'].get('xaxis', {}), tickvals=props['tickvals'], ticktext=props['ticktext']),
+            yaxis = dict(skeleton['layout'].get('yaxis', {}), range=props['range'])
         )
-        fig.update_xaxes(fixedrange=True)
-        fig.update_yaxes(fixedrange=True)
 
-        return fig
+        return dict(data=[trace], layout=layout)
+
+    '''Return a partial update carrying only the data-dependent properties of a chart'''
+    def patch(self, kind):
+        props = self.properties(kind)
+
+        patch = Patch()
+        patch['data'][0]['x'] = props['x']
+        patch['data'][0]['y'] = props['y']
+        patch['data'][0]['text'] = props['text']
+        patch['layout']['xaxis']['tickvals'] = props['tickvals']
+        patch['layout']['xaxis']['ticktext'] = props['ticktext']
+        patch['layout']['yaxis']['range'] = props['range']
+
+        return patch
+
+    '''Return a plot of forecasted temperature data'''
+    def plot_temp_forecast(self):
+        return self.plot('temp')
+
+    '''Return a plot of forecasted self.precipitation data'''
+    def plot_precip_forecast(self):
+        return self.plot('precip')
 
     '''Return a plot of forecasted self.humidity data'''
     def plot_humid_forecast(self):
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=list(range(len(self.humid))),
-            y=self.humid,
-            line_shape='spline',
-            fill='tozeroy',
-            mode='text',
-            # Display rounded temperatures above all points but the first and last
-            text=[round(self.humid[i]) if i in range(1,len(self.humid)-1) else None for i in range(len(self.humid))],
-            textfont=dict(size=14),
-            textposition='top center',
-            fillcolor='rgba(225, 204, 255, 0.5)'
-        ))
-        fig.update_layout(
-            template='plotly_white',
-            yaxis_title='Humidity %',
-            xaxis = dict(
-                tickvals = list(range(len(self.times))),
-                ticktext = self.times,
-            ),
-            margin = {
-                't': 50,
-                'b': 50
-            },
-            yaxis_range=(max(0, 0.5*(3*min(self.humid) - max(self.humid))), 0.5*(3*max(self.humid) - min(self.humid))),
-            font = dict(size=14)
-        )
-        fig.update_xaxes(fixedrange=True)
-        fig.update_yaxes(fixedrange=True)
-
-        return fig
\ No newline at end of file
+        return self.plot('humid')
\ No newline at end of file
@@ -0,0 +1,75 @@
+import numpy as np
+
+ICON_URL = 'https://openweathermap.org/img/wn/{}@4x.png'
+
+# Metres per second to miles per hour
+MPS_TO_MPH = 2.2369362920544
+
+'''
+Vectorized conversion of temperatures from kelvin to degrees Fahrenheit.
+'''
+def kelvin_to_fahrenheit(kelvin):
+    return (np.asarray(kelvin, dtype=float) - 273.15) * 9/5 + 32
+
+'''
+Return the weather icon URL for an OpenWeatherMap weather condition list.
+'''
+def get_icon_url(conditions):
+    return ICON_URL.format(conditions[0]['icon']) if conditions else None
+
+'''
+Compact, struct-of-arrays form of a One Call response.
+
+Only the fields the app displays are kept, in imperial units: a dict of scalars for current
+conditions, dicts of NumPy columns for the hourly and daily forecasts, and the raw alert list.
+'''
+class ForecastRecord():
+
+    __slots__ = ('version', 'current', 'hourly', 'daily', 'alerts')
+
+    def __init__(self, version, current, hourly, daily, alerts):
+        self.version = version
+        self.current = current
+        self.hourly = hourly
+        self.daily = daily
+        self.alerts = alerts
+
+    '''Decode a One Call payload in a single pass over each section'''
+    @classmethod
+    def from_onecall(cls, payload, version):
+        current = payload['current']
+
+        hourly_rows = np.array([
+            (h['temp'], (h.get('rain') or {}).get('1h', 0), h['humidity'], h.get('pop', 0))
+            for h in payload.get('hourly', [])
+        ], dtype=float).reshape(-1, 4)
+
+        daily_rows = np.array([
+            (d['temp']['max'], d['temp']['min'])
+            for d in payload.get('daily', [])
+        ], dtype=float).reshape(-1, 2)
+
+        hourly = dict(
+            temp = kelvin_to_fahrenheit(hourly_rows[:, 0]),
+            rain = hourly_rows[:, 1],
+            humidity = hourly_rows[:, 2],
+            pop = hourly_rows[:, 3]
+        )
+
+        daily = dict(
+            temp_max = kelvin_to_fahrenheit(daily_rows[:, 0]),
+            temp_min = kelvin_to_fahrenheit(daily_rows[:, 1]),
+            icon_url = [get_icon_url(d.get('weather')) for d in payload.get('daily', [])]
+        )
+
+        conditions = current.get('weather') or [{}]
+
+        current = dict(
+            temp = float(kelvin_to_fahrenheit(current['temp'])),
+            humidity = current['humidity'],
+            wind = current.get('wind_speed', 0) * MPS_TO_MPH,
+            status = conditions[0].get('description', ''),
+            icon_url = get_icon_url(current.get('weather'))
+        )
+
+        return cls(version, current, hourly, daily, payload.get('alerts', []))
\ No newline at end of file
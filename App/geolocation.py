@@ -0,0 +1,97 @@
+import http_client
+import ipaddress
+import metrics
+import os
+
+from cache import TTLCache
+from shared_cache import get_shared_cache
+
+# Path to an optional local GeoIP database (MaxMind .mmdb); ipinfo.io is queried when unset
+GEOIP_DB = os.environ.get('GEOIP_DB')
+
+'''
+Class for resolving client IP addresses to ipinfo-style location dictionaries.
+
+Results are cached both by exact address and by network prefix (/24 for IPv4, /48 for IPv6),
+so repeat visitors and their neighbours resolve without a lookup. When a local GeoIP database
+is configured it is memory-mapped and queried instead of ipinfo.io.
+'''
+class Geolocator():
+
+    # Seconds a resolved location is reused
+    CACHE_TTL = 6*60*60
+
+    # Seconds past expiry that a location is still served while it is looked up again
+    CACHE_STALE = 24*60*60
+
+    # Maximum number of addresses and prefixes held
+    CACHE_SIZE = 8192
+
+    def __init__(self, token, db_path=GEOIP_DB):
+        self.token = token
+        self.ip_cache = TTLCache(self.CACHE_TTL, self.CACHE_SIZE, get_shared_cache(), 'geo-ip', self.CACHE_STALE)
+        self.prefix_cache = TTLCache(self.CACHE_TTL, self.CACHE_SIZE, get_shared_cache(), 'geo-prefix', self.CACHE_STALE)
+        metrics.register_cache('geo-ip', self.ip_cache)
+        metrics.register_cache('geo-prefix', self.prefix_cache)
+        self.reader = None
+
+        if db_path:
+            import maxminddb
+
+            self.reader = maxminddb.open_database(db_path, maxminddb.MODE_MMAP)
+
+    '''Return the network prefix shared by neighbouring addresses, or the address itself if it cannot be parsed'''
+    @staticmethod
+    def prefix(ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return ip
+
+        length = 24 if address.version == 4 else 48
+
+        return str(ipaddress.ip_network(f'{address}/{length}', strict=False))
+
+    '''Return the location dictionary for an IP address
+
+    An address that cannot be resolved gets an empty dictionary, which callers treat as the default location
+    '''
+    def locate(self, ip):
+        data = self.ip_cache.get(ip)
+
+        if data is not None:
+            return data
+
+        def lookup():
+            data = self.lookup_local(ip) if self.reader else self.lookup_ipinfo(ip)
+            self.ip_cache.set(ip, data)
+            return data
+
+        try:
+            return self.prefix_cache.get_or_fetch(self.prefix(ip), lookup)
+        except Exception:
+            return {}
+
+    def lookup_ipinfo(self, ip):
+        response = http_client.get('ipinfo', f'/{ip}', params={'token': self.token})
+        response.raise_for_status()
+
+        return response.json()
+
+    '''Convert a GeoIP city record to the fields ipinfo.io would return'''
+    def lookup_local(self, ip):
+        record = self.reader.get(ip) or {}
+        data = {'ip': ip}
+
+        if 'city' in record:
+            data['city'] = record['city']['names'].get('en')
+        if record.get('subdivisions'):
+            data['region'] = record['subdivisions'][0]['names'].get('en')
+        if 'country' in record:
+            data['country'] = record['country'].get('iso_code')
+        if 'location' in record:
+            location = record['location']
+            data['timezone'] = location.get('time_zone')
+            data['loc'] = f'{location["latitude"]},{location["longitude"]}'
+
+        return data
\ No newline at end of file
@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+import tempfile
+
+'''
+Production gunicorn settings.
+
+Workers share upstream data through the SQLite cache at SHARED_CACHE_PATH, so adding workers
+does not multiply upstream traffic. Every setting can be overridden from the environment.
+'''
+
+# In a directory only this user can write (created 0700), as cached values are unpickled
+os.environ.setdefault('SHARED_CACHE_PATH', os.path.join(tempfile.gettempdir(), f'weather-widget-{os.geteuid()}', 'cache.sqlite3'))
+
+bind = os.environ.get('BIND', '0.0.0.0:80')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# gevent workers serve each request on a greenlet, so the /events stream every open dashboard
+# holds costs a small coroutine rather than a worker thread. Thread-based classes (gthread,
+# sync) are still supported, but then every stream pins a thread, so server push is off by
+# default with them and browsers poll instead.
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+ASYNC_WORKER = worker_class in ('gevent', 'eventlet')
+
+# Concurrent connections per async worker, and threads per gthread worker
+worker_connections = int(os.environ.get('WEB_CONNECTIONS', 2000))
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+if not ASYNC_WORKER:
+    os.environ.setdefault('PUSH_UPDATES', '0')
+
+# With thread-based workers, import and warm up the app once in the master and fork workers from
+# it, so they boot without repeating that work and share its memory. Async workers must patch the
+# standard library before the app is imported, so they import it themselves. WEB_PRELOAD overrides.
+preload_app = os.environ.get('WEB_PRELOAD', '0' if ASYNC_WORKER else '1') != '0'
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+
+'''Start each worker's background threads as soon as it boots, rather than on its first request'''
+def post_worker_init(worker):
+    import index
+
+    index.start()
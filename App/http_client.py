@@ -0,0 +1,171 @@
+import metrics
+import os
+import requests
+import threading
+import time
+
+from quota import BUDGETS, QuotaExceeded
+from requests.adapters import HTTPAdapter
+from resilience import CircuitOpenError, DeadlineExceeded, get_breaker
+from urllib3.exceptions import ReadTimeoutError
+
+'''
+Long-lived, pooled HTTP sessions for each upstream host.
+
+Every upstream request goes through get(), which reuses keep-alive connections from one
+session per host instead of paying for TCP and TLS setup on each call. Each host has a
+circuit breaker, and every request has an overall deadline, so a slow or failing upstream
+cannot hold worker threads. Base URLs, pool sizes and timeouts can be overridden through
+environment variables.
+'''
+
+# Base URL of each upstream host
+UPSTREAMS = {
+    'owm_api': os.environ.get('OWM_API_URL', 'https://api.openweathermap.org'),
+    'owm_tiles': os.environ.get('OWM_TILE_URL', 'https://tile.openweathermap.org'),
+    'ipinfo': os.environ.get('IPINFO_URL', 'https://ipinfo.io'),
+}
+
+# Maximum number of pooled connections kept open per host
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 32))
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (
+    float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+    float(os.environ.get('HTTP_READ_TIMEOUT', 10)),
+)
+
+# Seconds a request may take in total, including reading the response body
+DEADLINE = float(os.environ.get('HTTP_DEADLINE', 8))
+
+# Bytes read at a time while checking the deadline
+CHUNK_SIZE = 64*1024
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+'''Return the shared session for an upstream host, creating it on first use'''
+def get_session(upstream):
+    session = _SESSIONS.get(upstream)
+
+    if session is None:
+        with _SESSIONS_LOCK:
+            session = _SESSIONS.get(upstream)
+
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _SESSIONS[upstream] = session
+
+    return session
+
+'''Send a GET request for path on an upstream host through its pooled session
+
+Network errors, timeouts, server errors and rate limiting count against the host's circuit
+breaker; while it is open, CircuitOpenError is raised without contacting the host. Otherwise
+the call is charged to endpoint (default the host) in the host's call budget, if it has one;
+QuotaExceeded is raised without contacting the host once the budget is spent
+'''
+def get(upstream, path, timeout=TIMEOUT, deadline=DEADLINE, endpoint=None, **kwargs):
+    endpoint = endpoint or upstream
+    labels = dict(upstream=upstream, endpoint=endpoint, callback=metrics.current_callback())
+    breaker = get_breaker(upstream)
+
+    # Checked before the budget, so calls refused by an open circuit cost no quota
+    if not breaker.allow():
+        metrics.inc('upstream_requests_total', status='circuit_open', **labels)
+        raise CircuitOpenError(f'{upstream} circuit open')
+
+    budget = BUDGETS.get(upstream)
+
+    if budget is not None:
+        try:
+            budget.spend(endpoint)
+        except QuotaExceeded:
+            breaker.cancel()
+            metrics.inc('upstream_requests_total', status='quota', **labels)
+            raise
+
+    start = time.perf_counter()
+
+    try:
+        response = fetch(get_session(upstream), UPSTREAMS[upstream] + path, timeout, deadline, **kwargs)
+    except Exception:
+        breaker.failure()
+        metrics.inc('upstream_requests_total', status='error', **labels)
+        raise
+    finally:
+        metrics.observe('upstream_request_seconds', time.perf_counter() - start, upstream=upstream, endpoint=endpoint)
+
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.failure()
+    else:
+        breaker.success()
+
+    metrics.inc('upstream_requests_total', status=str(response.status_code), **labels)
+
+    return response
+
+'''Return the socket a streamed response is read from, or None if it cannot be reached'''
+def response_socket(response):
+    sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+
+    # http.client leaves the socket of a connection that will close to the response alone
+    if sock is None:
+        fp = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+
+    return sock
+
+'''Send a GET request and read its whole body within deadline seconds
+
+The wait for the response headers is bounded by the timeouts, each capped at the deadline, and
+every read of the body by the time left before the deadline
+'''
+def fetch(session, url, timeout, deadline, **kwargs):
+    end = time.monotonic() + deadline
+    timeout = tuple(min(t, deadline) for t in timeout)
+    response = session.get(url, timeout=timeout, stream=True, **kwargs)
+
+    # Read whatever has arrived rather than waiting for full chunks, where urllib3 supports it
+    read = getattr(response.raw, 'read1', None)
+    chunks = iter(lambda: read(CHUNK_SIZE, decode_content=True), b'') if read else response.iter_content(CHUNK_SIZE)
+    sock = response_socket(response)
+
+    try:
+        body = []
+
+        while True:
+            left = end - time.monotonic()
+
+            if left <= 0:
+                raise DeadlineExceeded(f'{url} exceeded {deadline}s deadline')
+
+            # Cap the next read at the time left
+            if sock is not None:
+                try:
+                    sock.settimeout(left)
+                # Closed once the whole body has arrived; the read then returns nothing
+                except OSError:
+                    pass
+
+            chunk = next(chunks, b'')
+
+            if not chunk:
+                break
+
+            body.append(chunk)
+    except ReadTimeoutError as e:
+        response.close()
+        raise DeadlineExceeded(f'{url} exceeded {deadline}s deadline') from e
+    except BaseException:
+        response.close()
+        raise
+
+    # Hand back an ordinary, fully read response
+    response._content = b''.join(body)
+    response._content_consumed = True
+
+    return response
@@ -1,11 +1,59 @@
 from app import app
-from layout import layout_function
+from forecast_plotter import CHARTS, ForecastPlotter
+from layout import layout_function, start_layout_refresher, validation_layout
 
 import callbacks
+import metrics
+import os
+import prefetch
+import push
+import threading
+import tile_proxy
 
 app.title = 'Weather Data'
+
+# Set first, so assigning the layout function does not call it to validate callbacks against
+app.validation_layout = validation_layout()
 app.layout = layout_function
 
+metrics.register(app.server)
+
+# Process that started the background threads, and the lock guarding their start
+_STARTED = None
+_START_LOCK = threading.Lock()
+
+'''Build what the first requests would otherwise build: the figure skeletons and the city index
+
+Makes no upstream requests and starts no threads, so it can run in the gunicorn master before
+workers are forked (preload_app), which then share the result
+'''
+def warm_up():
+    for kind in CHARTS:
+        ForecastPlotter.skeleton(kind)
+
+    lat, lon = map(float, callbacks.DAYTON['loc'].split(','))
+    callbacks.MGR.nearest_city(lat, lon)
+
+'''Start the background threads of this process: the layout refresher, prefetching and server push
+
+Threads do not survive a fork, so this runs once per worker process, from the gunicorn
+post_worker_init hook or else before the first request the process serves
+'''
+@app.server.before_request
+def start():
+    global _STARTED
+
+    if _STARTED != os.getpid():
+        with _START_LOCK:
+            if _STARTED != os.getpid():
+                start_layout_refresher()
+                prefetch.start_prefetch()
+                push.start_push()
+
+                _STARTED = os.getpid()
+
 if __name__ == '__main__':
-    # Run the server
-    app.run_server(debug=False, port=80, host='0.0.0.0')
\ No newline at end of file
+    # Run the development server; use wsgi.py under gunicorn in production
+    warm_up()
+    start()
+    app.run(debug=False, port=80, host='0.0.0.0')
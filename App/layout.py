@@ -1,20 +1,91 @@
+from cache import TTLCache
 from constants import get_constants
 from forecast_plotter import ForecastPlotter
+from weather_map import MAP_ZOOM
 
 from dash import dcc, html
 
 import dash_leaflet as dl
+import metrics
+import threading
 
-'''Define the layout of the Dash application'''
+# Seconds between background rebuilds of the default-location layout
+LAYOUT_REFRESH = 60
+
+# Served layouts fall back to a synchronous rebuild if the refresher stalls for this long
+LAYOUT_CACHE = TTLCache(10*LAYOUT_REFRESH, 1)
+metrics.register_cache('layout', LAYOUT_CACHE)
+
+'''Serve the layout of the Dash application
+
+The default-location layout is kept warm by start_layout_refresher, so page loads do not wait on upstream requests
+'''
 def layout_function():
+    return LAYOUT_CACHE.get_or_fetch('default', build_layout)
+
+'''Rebuild the cached layout every LAYOUT_REFRESH seconds in a daemon thread'''
+def start_layout_refresher():
+    def refresh():
+        while True:
+            try:
+                LAYOUT_CACHE.set('default', build_layout())
+            # Keep serving the previous layout if upstream is unavailable
+            except Exception:
+                pass
+
+            stop.wait(LAYOUT_REFRESH)
+
+    stop = threading.Event()
+    threading.Thread(target=refresh, name='layout-refresher', daemon=True).start()
+
+    return stop
+
+'''Return a data-free copy of every component build_layout defines, for Dash to validate callbacks against
+
+Dash would otherwise call layout_function at startup to find the components, blocking on an upstream fetch
+'''
+def validation_layout():
+    return html.Div([
+        html.Img(id='icon'),
+        dcc.Markdown(id='temp'),
+        dcc.Markdown(id='status'),
+        dcc.Markdown(id='location'),
+        dcc.Markdown(id='date-time-status'),
+        html.Details(id='emergency-alert-div'),
+        dcc.Markdown(id='emergency-alert'),
+        html.Div(id='tabs-div'),
+        dcc.Tabs(id='forecast-tabs'),
+        dcc.Graph(id='temperature-forecast'),
+        dcc.Graph(id='precipitation-forecast'),
+        dcc.Graph(id='humidity-forecast'),
+        dl.Map(id='map'),
+        *(dcc.Markdown(id=f'weekday-{i}') for i in range(7)),
+        *(html.Img(id=f'daily-forecast-{i}') for i in range(7)),
+        *(dcc.Markdown(id=f'hi-lo-{i}') for i in range(7)),
+        dcc.Interval(id='clock-interval'),
+        dcc.Interval(id='data-interval'),
+        dcc.Interval(id='thirty-minute-interval'),
+        dcc.Location(id='url'),
+        dcc.Store(id='memory-output'),
+        dcc.Store(id='map-layers-key'),
+        dcc.Store(id='data-version'),
+        dcc.Store(id='push-version'),
+        dcc.Store(id='alert-key'),
+        dcc.Store(id='figure-keys'),
+        dcc.Store(id='weather-status'),
+        dcc.Store(id='daily-forecast'),
+    ])
 
-    STATES_DF, DAYTON, OWM_KEY, IP_KEY, MGR = get_constants()
+'''Define the layout of the Dash application'''
+def build_layout():
 
-    wtr_manager, weather, city, state, country, timezone_name, lat, lon, time, weekday = MGR.initialize_weather(DAYTON, STATES_DF)
-    wtr = MGR.get_weather_fmt(weather)
-    forecast = MGR.get_forecast(wtr_manager, city, state, country, timezone_name)
-    forecast_plotter = ForecastPlotter(forecast)
-    weekdays, daily_hi, daily_lo, daily_icon = MGR.get_daily_forecast(wtr_manager, lat, lon, timezone_name)
+    STATES, DAYTON, OWM_KEY, IP_KEY, MGR = get_constants()
+
+    bundle = MGR.get_bundle(DAYTON, STATES)
+    weather, city, state, lat, lon, time, weekday = (bundle[k] for k in ('weather', 'city', 'state', 'lat', 'lon', 'time', 'weekday'))
+    wtr = bundle['weather_fmt']
+    forecast_plotter = ForecastPlotter(bundle['forecast'])
+    weekdays, daily_hi, daily_lo, daily_icon = bundle['daily']
 
     return html.Center(html.Div(
         className='app-body',
@@ -24,7 +95,7 @@ def layout_function():
                 [
                     html.Div(
                         [
-                            html.Img(id='icon', src=weather.weather_icon_url(size='4x'), width='100px'),
+                            html.Img(id='icon', src=weather['icon_url'], width='100px'),
 
                             dcc.Markdown(id='temp', children=f'## {wtr["temperature"]}'),
 
@@ -107,7 +178,7 @@ def layout_function():
                                 dl.TileLayer(),
                                 id = 'map',
                                 center = (lat, lon),
-                                zoom = 11,
+                                zoom = MAP_ZOOM,
                                 dragging = False,
                                 touchZoom = False,
                                 doubleClickZoom = False,
@@ -163,9 +234,18 @@ def layout_function():
 
             html.Br(),
 
+            # Drives the client-side clock only; no server round trip
             dcc.Interval(
-                id='minute-interval',
-                interval= 60*1000, # one minute (ms)
+                id='clock-interval',
+                interval= 10*1000, # ten seconds (ms)
+                n_intervals=0
+            ),
+
+            # Fallback check for new upstream data, matching the forecast cache lifetime;
+            # disabled by assets/push.js while server push is connected
+            dcc.Interval(
+                id='data-interval',
+                interval= 5*60*1000, # five minutes (ms)
                 n_intervals=0
             ),
 
@@ -179,7 +259,28 @@ def layout_function():
             dcc.Location(id='url'),
 
             # Storing client ip in a Store object
-            dcc.Store(id='memory-output', data=DAYTON)
+            dcc.Store(id='memory-output', data=DAYTON),
+
+            # Identifies the weather map layers currently shown
+            dcc.Store(id='map-layers-key'),
+
+            # Identifies the upstream data currently shown
+            dcc.Store(id='data-version', data=bundle['version']),
+
+            # Latest data version pushed by the server (set by assets/push.js)
+            dcc.Store(id='push-version'),
+
+            # Fingerprint of the emergency alerts currently shown
+            dcc.Store(id='alert-key'),
+
+            # Fingerprints of the data shown in each forecast figure
+            dcc.Store(id='figure-keys', data={kind: forecast_plotter.fingerprint(kind) for kind in ('temp', 'precip', 'humid')}),
+
+            # Weather status and timezone used by the client-side clock
+            dcc.Store(id='weather-status', data=dict(status=wtr['status'], timezone=bundle['timezone'])),
+
+            # Daily forecast shared by the weekday, icon and high/low outputs
+            dcc.Store(id='daily-forecast', data=dict(weekdays=weekdays, hi=daily_hi, lo=daily_lo, icons=daily_icon))
 
         ]
     ))
\ No newline at end of file
@@ -0,0 +1,227 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+from flask import Response
+
+# Name of a Dash callback to profile with cProfile; profiling is off when unset
+PROFILE_CALLBACK = os.environ.get('PROFILE_CALLBACK')
+
+# Fraction of calls to the profiled callback that are sampled
+PROFILE_RATE = float(os.environ.get('PROFILE_RATE', 0.01))
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+'''
+Cumulative latency histogram with fixed buckets.
+'''
+class Histogram():
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+        self.sum += value
+        self.count += 1
+
+'''
+In-process registry of counters and latency histograms, rendered in Prometheus text format.
+
+Other state (cache sizes and hit counts, call budgets, breaker states) is read on each scrape
+from collectors: functions returning (name, type, labels, value) samples. Every gunicorn worker
+keeps its own registry, so each scrape reports the worker that served it.
+'''
+class Registry():
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            histogram = self.histograms.get(key)
+
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+
+            histogram.observe(value)
+
+    '''Time the enclosed block into the histogram name'''
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        samples = {}
+
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                samples.setdefault((name, 'counter'), []).append((dict(labels), value))
+
+            for (name, labels), histogram in self.histograms.items():
+                lines = samples.setdefault((name, 'histogram'), [])
+                cumulative = 0
+
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append((dict(labels, le=str(bound)), cumulative, '_bucket'))
+
+                lines.append((dict(labels, le='+Inf'), histogram.count, '_bucket'))
+                lines.append((dict(labels), histogram.sum, '_sum'))
+                lines.append((dict(labels), histogram.count, '_count'))
+
+        for collect in self.collectors:
+            try:
+                for name, kind, labels, value in collect():
+                    samples.setdefault((name, kind), []).append((labels, value))
+            # A broken collector should not hide the other metrics
+            except Exception:
+                continue
+
+        out = []
+
+        for (name, kind), lines in sorted(samples.items()):
+            out.append(f'# TYPE {name} {kind}')
+
+            for labels, value, *suffix in lines:
+                out.append(f'{name}{suffix[0] if suffix else ""}{format_labels(labels)} {value}')
+
+        return '\n'.join(out) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+REGISTRY = Registry()
+
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+collector = REGISTRY.collector
+
+_CONTEXT = threading.local()
+
+'''Return the name of the Dash callback running on this thread, or 'background' outside callbacks'''
+def current_callback():
+    return getattr(_CONTEXT, 'callback', 'background')
+
+_CACHES = {}
+
+'''Report a TTLCache's size and hit, stale and miss counts under name'''
+def register_cache(name, cache):
+    _CACHES[name] = cache
+
+@collector
+def collect_caches():
+    for name, cache in list(_CACHES.items()):
+        yield 'cache_entries', 'gauge', {'cache': name}, len(cache)
+
+        for result, count in list(cache.stats.items()):
+            yield 'cache_lookups_total', 'counter', {'cache': name, 'result': result}, count
+
+_PROFILE = None
+_PROFILE_LOCK = threading.Lock()
+
+# Held while a sample is being profiled; only one profiler may run at a time
+_SAMPLING = threading.Lock()
+
+'''Time a Dash callback, attributing upstream calls made during it to the callback
+
+The callback named by PROFILE_CALLBACK also has a PROFILE_RATE sample of its calls run under
+cProfile, with the aggregated statistics served at /metrics/profile
+'''
+def timed_callback(func):
+    name = func.__name__
+    profiled = name == PROFILE_CALLBACK
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _CONTEXT.callback = name
+
+        try:
+            with timer('dash_callback_seconds', callback=name):
+                if profiled and random.random() < PROFILE_RATE and _SAMPLING.acquire(blocking=False):
+                    try:
+                        return profile(func, *args, **kwargs)
+                    finally:
+                        _SAMPLING.release()
+
+                return func(*args, **kwargs)
+        finally:
+            _CONTEXT.callback = 'background'
+
+    return wrapper
+
+def profile(func, *args, **kwargs):
+    global _PROFILE
+
+    profiler = cProfile.Profile()
+
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        with _PROFILE_LOCK:
+            if _PROFILE is None:
+                _PROFILE = pstats.Stats(profiler)
+            else:
+                _PROFILE.add(profiler)
+
+'''Return the aggregated profile of the sampled callback, sorted by cumulative time'''
+def profile_report(limit=40):
+    with _PROFILE_LOCK:
+        if _PROFILE is None:
+            return 'No samples profiled; set PROFILE_CALLBACK to a callback name.\n'
+
+        out = io.StringIO()
+        _PROFILE.stream = out
+        _PROFILE.sort_stats('cumulative').print_stats(limit)
+
+        return out.getvalue()
+
+'''Serve /metrics and /metrics/profile from a Flask server'''
+def register(server):
+    @server.route('/metrics')
+    def serve_metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/metrics/profile')
+    def serve_profile():
+        return Response(profile_report(), mimetype='text/plain')
@@ -0,0 +1,118 @@
+import metrics
+import random
+import threading
+import time
+
+from constants import get_constants
+
+STATES, DAYTON, OWM_KEY, IP_KEY, MGR = get_constants()
+
+'''
+Class for keeping the upstream data of actively viewed locations warm in the background.
+
+Callbacks touch the locations they serve. Each touched location is checked about once per
+period, with random jitter so locations do not refresh in lockstep, and its data is refetched
+whenever it is within ahead seconds of expiring, so callbacks read cached data instead of
+waiting on upstream. Locations nobody has touched for idle seconds are dropped, unless pinned.
+'''
+class PrefetchScheduler():
+
+    # Seconds between checks of each location
+    PERIOD = 60
+
+    # Fraction of PERIOD by which each check is randomly brought forward
+    JITTER = 0.2
+
+    # Refetch data that expires within this many seconds; must exceed PERIOD
+    AHEAD = 90
+
+    # Seconds without a touch after which a location is no longer prefetched
+    IDLE = 15*60
+
+    # Seconds the scheduler sleeps between scans for due locations
+    TICK = 1
+
+    def __init__(self, prefetch, key, executor):
+        # prefetch(location, ahead) refreshes a location's data; key(location) identifies it
+        self.prefetch = prefetch
+        self.key = key
+        self.executor = executor
+        self._locations = {}
+        self._lock = threading.Lock()
+
+    '''Record that location is being viewed, scheduling it for prefetching if it is new'''
+    def touch(self, location, pinned=False):
+        try:
+            key = self.key(location)
+        except Exception:
+            return
+
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._locations.get(key)
+
+            if entry is None:
+                self._locations[key] = dict(location=location, seen=now, due=now + self.delay(), pinned=pinned, running=False)
+            else:
+                entry.update(location=location, seen=now, pinned=entry['pinned'] or pinned)
+
+    def delay(self):
+        return self.PERIOD * (1 - self.JITTER*random.random())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._locations)
+
+    '''Drop idle locations and submit a prefetch for each location that is due'''
+    def run_once(self):
+        now = time.monotonic()
+        due = []
+
+        with self._lock:
+            for key, entry in list(self._locations.items()):
+                if not entry['pinned'] and now - entry['seen'] > self.IDLE:
+                    del self._locations[key]
+                elif entry['due'] <= now and not entry['running']:
+                    entry['running'] = True
+                    due.append((key, entry))
+
+        for key, entry in due:
+            self.executor.submit(self.run_location, key, entry)
+
+    def run_location(self, key, entry):
+        try:
+            self.prefetch(entry['location'], self.AHEAD)
+        # Callbacks fall back to fetching inline; the next check will try again
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                entry['running'] = False
+                entry['due'] = time.monotonic() + self.delay()
+
+    def start(self):
+        def run():
+            while not stop.wait(self.TICK):
+                self.run_once()
+
+        stop = threading.Event()
+        threading.Thread(target=run, name='prefetch-scheduler', daemon=True).start()
+
+        return stop
+
+SCHEDULER = PrefetchScheduler(
+    lambda location, ahead: MGR.prefetch(location, STATES, ahead),
+    lambda location: MGR.location_key(location, STATES),
+    MGR.EXECUTOR
+)
+
+@metrics.collector
+def collect_scheduler():
+    yield 'prefetch_locations', 'gauge', {}, len(SCHEDULER)
+
+'''Start prefetching, keeping the default location used by the served layout always warm'''
+def start_prefetch():
+    SCHEDULER.touch(DAYTON, pinned=True)
+
+    return SCHEDULER.start()
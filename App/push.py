@@ -0,0 +1,160 @@
+import metrics
+import os
+import queue
+import threading
+
+from app import app
+from callbacks import GEO, MGR, STATES
+from prefetch import SCHEDULER
+from flask import Response, abort, request, stream_with_context
+
+# Set to 0 to disable server push; clients then fall back to polling on data-interval
+PUSH_UPDATES = os.environ.get('PUSH_UPDATES', '1') != '0'
+
+# Seconds between checks of each subscribed location for new data
+PUSH_INTERVAL = float(os.environ.get('PUSH_INTERVAL', 60))
+
+# Seconds between keep-alive comments on idle event streams
+HEARTBEAT = 15
+
+'''
+Class for fanning out data updates to every client watching a location.
+
+Clients subscribe over Server-Sent Events. A single background thread refreshes every location
+that has subscribers once per interval, all in one concurrent batch, and broadcasts the new data
+version to a location's subscribers when it changes, so idle dashboards cost no requests between
+actual weather updates.
+'''
+class Broadcaster():
+
+    def __init__(self, refresh, interval=PUSH_INTERVAL):
+        # refresh(locations) returns the current data version of each location, or the exception
+        # raised refreshing it
+        self.refresh = refresh
+        self.interval = interval
+        self._subscribers = {}
+        self._locations = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, location):
+        subscriber = queue.Queue(maxsize=1)
+
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscriber)
+            self._locations[key] = location
+
+        return subscriber
+
+    def unsubscribe(self, key, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(key, set())
+            subscribers.discard(subscriber)
+
+            if not subscribers:
+                self._subscribers.pop(key, None)
+                self._locations.pop(key, None)
+                self._versions.pop(key, None)
+
+    '''Send version to every subscriber of key, replacing any version they have not yet received'''
+    def publish(self, key, version):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+
+        for subscriber in subscribers:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+
+            try:
+                subscriber.put_nowait(version)
+            except queue.Full:
+                pass
+
+    '''Refresh every subscribed location once, publishing versions that changed'''
+    def run_once(self):
+        with self._lock:
+            keys, locations = list(self._locations), list(self._locations.values())
+
+        if not keys:
+            return
+
+        for key, version in zip(keys, self.refresh(locations)):
+            # Keep the last version; the next pass will try again
+            if isinstance(version, Exception):
+                continue
+
+            with self._lock:
+                changed = key in self._subscribers and self._versions.get(key) != version
+
+                if changed:
+                    self._versions[key] = version
+
+            if changed:
+                self.publish(key, version)
+
+    def start(self):
+        def run():
+            while not stop.wait(self.interval):
+                self.run_once()
+
+        stop = threading.Event()
+        threading.Thread(target=run, name='push-updater', daemon=True).start()
+
+        return stop
+
+    '''Yield Server-Sent Events for key until the client disconnects'''
+    def stream(self, key, location, heartbeat=HEARTBEAT):
+        subscriber = self.subscribe(key, location)
+
+        try:
+            yield 'retry: 10000\n\n'
+
+            while True:
+                try:
+                    version = subscriber.get(timeout=heartbeat)
+                    yield f'event: update\ndata: {version}\n\n'
+                except queue.Empty:
+                    yield ': ping\n\n'
+        finally:
+            self.unsubscribe(key, subscriber)
+
+'''Return the current data version of each location, keeping them prefetched while they have subscribers'''
+def current_versions(locations):
+    for location in locations:
+        SCHEDULER.touch(location)
+
+    bundles = MGR.get_bundles(locations, STATES)
+
+    return [bundle if isinstance(bundle, Exception) else bundle['version'] for bundle in bundles]
+
+BROADCASTER = Broadcaster(current_versions)
+
+@metrics.collector
+def collect_subscribers():
+    with BROADCASTER._lock:
+        count = sum(len(subscribers) for subscribers in BROADCASTER._subscribers.values())
+
+    yield 'push_subscribers', 'gauge', {}, count
+
+'''Stream data updates for the requesting client's location'''
+@app.server.route('/events')
+def events():
+    if not PUSH_UPDATES:
+        abort(404)
+
+    location = GEO.locate(request.remote_addr)
+    bundle = MGR.get_bundle(location, STATES)
+    key = MGR.coords_key(bundle['lat'], bundle['lon'])
+
+    return Response(
+        stream_with_context(BROADCASTER.stream(key, location)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+'''Start the background updater when push is enabled'''
+def start_push():
+    if PUSH_UPDATES:
+        return BROADCASTER.start()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import metrics
+import os
+import requests
+import threading
+import time
+
+from collections import Counter
+from shared_cache import get_shared_cache
+
+# Upstream calls allowed on the OpenWeatherMap key, per minute and per day
+OWM_MINUTE_CAP = int(os.environ.get('OWM_MINUTE_CAP', 60))
+OWM_DAILY_CAP = int(os.environ.get('OWM_DAILY_CAP', 30000))
+
+'''
+Raised instead of calling an upstream whose call budget is spent.
+'''
+class QuotaExceeded(requests.RequestException):
+    pass
+
+'''
+Token bucket holding up to capacity tokens, refilled continuously at rate tokens per second.
+'''
+class TokenBucket():
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    '''Add the tokens accrued since the last refill, returning the tokens held'''
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+
+        return self.tokens
+
+'''
+Call budget for an API key, shared by every upstream that bills against it.
+
+Calls are limited by a per-minute and a per-day token bucket; the buckets live in the
+cross-process shared cache when one is configured, so every worker draws on one budget.
+Calls are counted per endpoint, and usage (the fuller of the two buckets) drives stretch(),
+the factor by which callers lengthen cache lifetimes and refresh intervals as the cap nears.
+'''
+class QuotaBudget():
+
+    # Usage above which cache lifetimes start to stretch
+    STRETCH_FROM = 0.5
+
+    # Factor by which lifetimes are stretched when the budget is exhausted
+    MAX_STRETCH = 4
+
+    def __init__(self, name, per_minute, per_day, shared=None):
+        self.name = name
+        self.limits = {'minute': (per_minute/60, per_minute), 'day': (per_day/86400, per_day)}
+        self.shared = shared
+        self.buckets = {period: TokenBucket(rate, capacity) for period, (rate, capacity) in self.limits.items()}
+        self.levels = {period: 1.0 for period in self.limits}
+        self.calls = Counter()
+        self.rejected = Counter()
+        self._lock = threading.Lock()
+
+    '''Take a token from every bucket if each holds one, otherwise from none; returns whether they were taken'''
+    def take(self):
+        periods = list(self.limits)
+
+        if self.shared is not None:
+            taken, levels = self.shared.take([(f'{self.name}:{period}', *self.limits[period]) for period in periods])
+        else:
+            with self._lock:
+                levels = [self.buckets[period].refill() for period in periods]
+                taken = all(tokens >= 1 for tokens in levels)
+
+                if taken:
+                    for period in periods:
+                        self.buckets[period].tokens -= 1
+
+                    levels = [tokens - 1 for tokens in levels]
+
+        for period, tokens in zip(periods, levels):
+            self.levels[period] = tokens / self.limits[period][1]
+
+        return taken
+
+    '''Spend one call on endpoint, raising QuotaExceeded if either bucket is empty'''
+    def spend(self, endpoint):
+        taken = self.take()
+
+        with self._lock:
+            (self.calls if taken else self.rejected)[endpoint] += 1
+
+        if not taken:
+            raise QuotaExceeded(f'{self.name} call budget exhausted')
+
+    '''Return the fraction of the tighter budget in use, as of the last call'''
+    def usage(self):
+        return 1 - min(self.levels.values())
+
+    '''Return the factor by which to lengthen cache lifetimes at the current usage'''
+    def stretch(self):
+        pressure = max(0, self.usage() - self.STRETCH_FROM) / (1 - self.STRETCH_FROM)
+
+        return 1 + (self.MAX_STRETCH - 1)*pressure
+
+OWM_BUDGET = QuotaBudget('owm', OWM_MINUTE_CAP, OWM_DAILY_CAP, get_shared_cache())
+
+# Budget each upstream host bills against
+BUDGETS = {
+    'owm_api': OWM_BUDGET,
+    'owm_tiles': OWM_BUDGET,
+}
+
+@metrics.collector
+def collect_budgets():
+    for budget in set(BUDGETS.values()):
+        yield 'quota_usage_ratio', 'gauge', {'budget': budget.name}, budget.usage()
+        yield 'quota_stretch_factor', 'gauge', {'budget': budget.name}, budget.stretch()
+
+        for endpoint, count in list(budget.rejected.items()):
+            yield 'quota_rejected_total', 'counter', {'budget': budget.name, 'endpoint': endpoint}, count
@@ -0,0 +1,99 @@
+import metrics
+import requests
+import threading
+import time
+
+'''
+Raised instead of calling an upstream whose circuit breaker is open.
+'''
+class CircuitOpenError(requests.RequestException):
+    pass
+
+'''
+Raised when an upstream response does not complete within its overall deadline.
+'''
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+'''
+Circuit breaker for a single upstream host.
+
+After threshold consecutive failures the circuit opens and calls are refused for cooldown
+seconds, so a failing upstream is not hammered and callers fail fast (and fall back to stale
+data) instead of tying up worker threads. A single trial call is then let through; its
+success closes the circuit and its failure opens it again.
+'''
+class CircuitBreaker():
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened is None:
+                return 'closed'
+
+            return 'half-open' if time.monotonic() - self.opened >= self.cooldown else 'open'
+
+    '''Return True if a call may be made now, reserving the trial call when half-open'''
+    def allow(self):
+        with self._lock:
+            if self.opened is None:
+                return True
+
+            if time.monotonic() - self.opened < self.cooldown or self.trial:
+                return False
+
+            self.trial = True
+
+            return True
+
+    '''Give back a trial call reserved by allow() that is not going to be made'''
+    def cancel(self):
+        with self._lock:
+            self.trial = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+
+            if self.trial or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+            self.trial = False
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+'''Return the process-wide circuit breaker for an upstream, creating it on first use'''
+def get_breaker(name):
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker()
+
+        return breaker
+
+# Breaker states reported as 0 (closed), 1 (half-open) or 2 (open)
+STATES = {'closed': 0, 'half-open': 1, 'open': 2}
+
+@metrics.collector
+def collect_breakers():
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.items())
+
+    for name, breaker in breakers:
+        yield 'circuit_breaker_state', 'gauge', {'upstream': name}, STATES[breaker.state]
@@ -0,0 +1,179 @@
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+# Path of the SQLite file shared by every worker process; the shared tier is disabled when unset
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH')
+
+'''
+Cross-process cache stored in a SQLite database in WAL mode.
+
+Worker processes on one host open the same file, so each piece of upstream data is fetched
+once per host rather than once per worker. Values are pickled with an absolute expiry time,
+and short-lived leases let one process fetch a key while the others wait for its result.
+Token buckets kept in the same file let every process draw on one upstream call budget.
+
+Database errors are treated as misses (and as an acquired lease or a granted token), so a
+busy or broken file degrades to per-process caching rather than failing requests. Values are
+unpickled, so the file and its directory must belong to this user and be writable by no one else.
+'''
+class SharedCache():
+
+    # Fraction of writes that also purge expired rows
+    PURGE_RATE = 0.01
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+        check_private(path)
+
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value BLOB, expires REAL, PRIMARY KEY (namespace, key))')
+            connection.execute('CREATE TABLE IF NOT EXISTS leases (namespace TEXT, key TEXT, owner TEXT, expires REAL, PRIMARY KEY (namespace, key))')
+            connection.execute('CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    '''Return this thread's connection, reopening it after a fork'''
+    def connect(self):
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return connection
+
+    '''Return (value, seconds remaining) for a key, or None if missing or expired'''
+    def get(self, namespace, key):
+        try:
+            row = self.connect().execute(
+                'SELECT value, expires FROM entries WHERE namespace=? AND key=?', (namespace, repr(key))
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+
+        if row is None:
+            return None
+
+        remaining = row[1] - time.time()
+
+        if remaining <= 0:
+            return None
+
+        return pickle.loads(row[0]), remaining
+
+    def set(self, namespace, key, value, ttl):
+        try:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                (namespace, repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+            )
+
+            if random.random() < self.PURGE_RATE:
+                connection.execute('DELETE FROM entries WHERE expires < ?', (time.time(),))
+        except sqlite3.Error:
+            pass
+
+    '''Try to take the lease on a key for ttl seconds; returns True if this process now holds it'''
+    def acquire(self, namespace, key, ttl):
+        owner = f'{os.getpid()}:{threading.get_ident()}'
+        now = time.time()
+
+        try:
+            connection = self.connect()
+            connection.execute('DELETE FROM leases WHERE namespace=? AND key=? AND expires < ?', (namespace, repr(key), now))
+            cursor = connection.execute('INSERT OR IGNORE INTO leases VALUES (?, ?, ?, ?)', (namespace, repr(key), owner, now + ttl))
+        except sqlite3.Error:
+            return True
+
+        return cursor.rowcount == 1
+
+    def release(self, namespace, key):
+        try:
+            self.connect().execute('DELETE FROM leases WHERE namespace=? AND key=?', (namespace, repr(key)))
+        except sqlite3.Error:
+            pass
+
+    '''Take n tokens from each of several token buckets shared by every process, or from none
+
+    buckets is a list of (name, rate, capacity); buckets start full and refill at rate tokens per
+    second up to capacity. Tokens are only taken if every bucket holds n. Returns (taken, tokens
+    left in each bucket)
+    '''
+    def take(self, buckets, n=1):
+        now = time.time()
+
+        try:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                levels = []
+
+                for name, rate, capacity in buckets:
+                    row = connection.execute('SELECT tokens, updated FROM buckets WHERE name=?', (name,)).fetchone()
+                    levels.append(capacity if row is None else min(capacity, row[0] + max(0, now - row[1])*rate))
+
+                taken = all(tokens >= n for tokens in levels)
+
+                if taken:
+                    levels = [tokens - n for tokens in levels]
+
+                connection.executemany('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', [(name, tokens, now) for (name, _rate, _capacity), tokens in zip(buckets, levels)])
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            return True, [capacity for _name, _rate, capacity in buckets]
+
+        return taken, levels
+
+'''Raise PermissionError unless the directory of path, and path if it exists, belong to this user and only it can write them
+
+Anyone else able to write the database (or create it, or its journal, in the directory) could
+have every worker unpickle a value of their choosing
+'''
+def check_private(path):
+    path = os.path.abspath(path)
+
+    for name in (os.path.dirname(path), path):
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
+            continue
+
+        if stat.st_uid != os.geteuid() or stat.st_mode & 0o022:
+            raise PermissionError(f'{name} must belong to this user and not be writable by others')
+
+_SHARED = None
+_SHARED_OPENED = False
+_SHARED_LOCK = threading.Lock()
+
+'''Return the process-wide shared cache, or None if SHARED_CACHE_PATH is not configured
+
+A file that cannot be opened, or is not private to this user, also gives None, so each process
+caches on its own
+'''
+def get_shared_cache():
+    global _SHARED, _SHARED_OPENED
+
+    if SHARED_CACHE_PATH and not _SHARED_OPENED:
+        with _SHARED_LOCK:
+            if not _SHARED_OPENED:
+                try:
+                    _SHARED = SharedCache(SHARED_CACHE_PATH)
+                except (OSError, sqlite3.Error):
+                    _SHARED = None
+
+                _SHARED_OPENED = True
+
+    return _SHARED
\ No newline at end of file
@@ -0,0 +1,231 @@
+import hashlib
+import http_client
+import json
+import metrics
+import os
+import tempfile
+import threading
+import time
+
+from app import app
+from cache import SingleFlight, TTLCache
+from constants import get_constants
+from flask import Response, abort, request
+from quota import OWM_BUDGET
+from weather_map import MAP_MODES, MAP_ZOOM
+
+# Only the tiles the dashboard map can show are proxied, as each distinct tile costs an upstream
+# call from the OpenWeatherMap budget and space in the disk cache
+MODES = set(MAP_MODES)
+MAX_ZOOM = MAP_ZOOM
+
+# Seconds a tile is served before revalidating with OpenWeatherMap, matching its map refresh cadence
+TILE_TTL = 10*60
+
+# Directory backing the in-memory tile cache
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'weather-tiles'))
+
+# Megabytes the disk cache may hold; the least recently fetched tiles are removed beyond this
+TILE_CACHE_MB = int(os.environ.get('TILE_CACHE_MB', 256))
+
+# Seconds after its last fetch that a tile is removed from disk, matching the memory cache
+TILE_MAX_AGE = 24*60*60
+
+# Tiles saved by a process between prunes of the disk cache
+PRUNE_EVERY = 256
+
+'''
+A cached map tile with the validators needed to revalidate it upstream.
+'''
+class Tile():
+
+    def __init__(self, data, fetched, upstream_etag=None, last_modified=None):
+        self.data = data
+        self.fetched = fetched
+        self.upstream_etag = upstream_etag
+        self.last_modified = last_modified
+        self.etag = hashlib.sha1(data).hexdigest()
+
+    def age(self):
+        return time.time() - self.fetched
+
+'''
+Class for serving OpenWeatherMap tiles from a bounded in-memory LRU backed by an on-disk cache.
+
+Fresh tiles are served without contacting OpenWeatherMap; stale tiles are revalidated with a
+conditional request, and the stale copy is served if that request fails. Tiles stay fresh for
+longer as the OpenWeatherMap call budget runs low. The disk cache is pruned every PRUNE_EVERY
+saves to tiles fetched within max_age seconds, and then to max_bytes.
+'''
+class TileCache():
+
+    def __init__(self, key, cache_dir=TILE_CACHE_DIR, ttl=TILE_TTL, maxsize=1024, max_bytes=TILE_CACHE_MB << 20, max_age=TILE_MAX_AGE):
+        self.key = key
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._saves = 0
+        self._saves_lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        # Memory entries outlive their freshness so they can be revalidated rather than refetched
+        self.memory = TTLCache(24*60*60, maxsize)
+        metrics.register_cache('tiles', self.memory)
+        self._flight = SingleFlight()
+
+    '''Return the seconds a tile is currently served before revalidating'''
+    def freshness(self):
+        return self.ttl * OWM_BUDGET.stretch()
+
+    def get(self, mode, z, x, y):
+        key = (mode, z, x, y)
+        tile = self.memory.get(key) or self.load(key)
+
+        if tile is not None and tile.age() < self.freshness():
+            return tile
+
+        return self._flight.do(key, lambda: self.revalidate(key, tile))
+
+    def revalidate(self, key, tile):
+        mode, z, x, y = key
+        headers = {}
+
+        if tile is not None:
+            if tile.upstream_etag:
+                headers['If-None-Match'] = tile.upstream_etag
+            if tile.last_modified:
+                headers['If-Modified-Since'] = tile.last_modified
+
+        try:
+            response = http_client.get('owm_tiles', f'/map/{mode}/{z}/{x}/{y}.png', params={'appid': self.key}, headers=headers, endpoint='tiles')
+
+            if response.status_code == 304 and tile is not None:
+                tile.fetched = time.time()
+            else:
+                response.raise_for_status()
+                tile = Tile(response.content, time.time(), response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        # Serve the stale copy rather than failing the request
+        except Exception:
+            if tile is None:
+                raise
+
+            return tile
+
+        self.memory.set(key, tile)
+        self.save(key, tile)
+
+        return tile
+
+    def path(self, key):
+        mode, z, x, y = key
+        return os.path.join(self.cache_dir, mode, str(z), str(x), f'{y}.png')
+
+    def load(self, key):
+        path = self.path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.json') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        tile = Tile(data, meta['fetched'], meta.get('etag'), meta.get('last_modified'))
+        self.memory.set(key, tile)
+
+        return tile
+
+    def save(self, key, tile):
+        path = self.path(key)
+        meta = {'fetched': tile.fetched, 'etag': tile.upstream_etag, 'last_modified': tile.last_modified}
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Write to temporary files first so readers never see a partial tile
+            with open(path + '.tmp', 'wb') as f:
+                f.write(tile.data)
+            with open(path + '.json.tmp', 'w') as f:
+                json.dump(meta, f)
+
+            os.replace(path + '.tmp', path)
+            os.replace(path + '.json.tmp', path + '.json')
+        # The disk cache is best effort; the tile is still held in memory
+        except OSError:
+            pass
+
+        with self._saves_lock:
+            self._saves += 1
+            due = self._saves % PRUNE_EVERY == 0
+
+        if due:
+            self.prune()
+
+    '''Remove tiles last fetched over max_age seconds ago, then the oldest tiles beyond max_bytes
+
+    Safe to run from several processes at once; a tile removed while being read is refetched
+    '''
+    def prune(self):
+        if not self._prune_lock.acquire(blocking=False):
+            return
+
+        try:
+            now = time.time()
+            tiles = []
+
+            for root, _dirs, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith('.png'):
+                        continue
+
+                    path = os.path.join(root, name)
+
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    tiles.append((stat.st_mtime, stat.st_size, path))
+
+            tiles.sort(reverse=True)
+            total = 0
+
+            for fetched, size, path in tiles:
+                total += size
+
+                if now - fetched > self.max_age or total > self.max_bytes:
+                    for stale in (path, path + '.json'):
+                        try:
+                            os.remove(stale)
+                        except OSError:
+                            pass
+        finally:
+            self._prune_lock.release()
+
+STATES, DAYTON, OWM_KEY, IP_KEY, MGR = get_constants()
+
+TILES = TileCache(OWM_KEY)
+
+'''Serve a weather map tile without exposing the API key to the browser'''
+@app.server.route('/tiles/<mode>/<int:z>/<int:x>/<int:y>.png')
+def serve_tile(mode, z, x, y):
+    if mode not in MODES or not 0 <= z <= MAX_ZOOM or not (0 <= x < 2**z and 0 <= y < 2**z):
+        abort(404)
+
+    try:
+        tile = TILES.get(mode, z, x, y)
+    except Exception:
+        abort(502)
+
+    max_age = max(0, int(TILES.freshness() - tile.age()))
+
+    if tile.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(tile.data, mimetype='image/png')
+
+    response.set_etag(tile.etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+
+    return response
\ No newline at end of file
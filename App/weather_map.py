@@ -1,73 +1,122 @@
 import dash_leaflet as dl
+import math
 
-from pyowm.utils.geo import Point
-from pyowm.commons.tile import Tile
+from functools import lru_cache
+
+# Decimal places coordinates are rounded to before selecting tiles, roughly 100 metres
+QUANTIZE_DIGITS = 3
+
+# Zoom of the dashboard map; tile selection only ever zooms out from it
+MAP_ZOOM = 11
+
+# Weather layers drawn over the dashboard map
+MAP_MODES = ('precipitation',)
+
+'''
+Converts latitude and longitude to fractional Web Mercator coordinates in [0, 1).
+
+Tile coordinates at any zoom are these scaled by 2**zoom, so each point is projected only once.
+'''
+def get_mercator_coords(lat, lon):
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0
+    return x, y
 
 '''
 Converts latitude and longitude to map tile coordinates.
 '''
 def get_tile_coords(lat, lon, zoom):
-    geopoint = Point(lon, lat)
-    tile_x, tile_y = Tile.tile_coords_for_point(geopoint, zoom)
-    return tile_x, tile_y
+    x, y = get_mercator_coords(lat, lon)
+    n = 2 ** zoom
+    return int(x * n), int(y * n)
 
 '''
 Retrieves coordinates of bounding corners for a given map tile.
 '''
 def get_tile_bounds(tile_x, tile_y, zoom):
-    x1, y1, x2, y2 = Tile.tile_coords_to_bbox(tile_x, tile_y, zoom)
+    n = 2.0 ** zoom
+    x1 = tile_x / n * 360.0 - 180.0
+    x2 = (tile_x + 1) / n * 360.0 - 180.0
+    y1 = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (tile_y + 1) / n))))
+    y2 = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
     tile_bounds = [[y1,x1],[y2,x2]]
     return tile_bounds
 
 '''
 Loads a weathermap layer for a given tile and map mode.
+
+Tiles are fetched through the server's caching tile proxy, which holds the API key.
 '''
-def get_weathermap_layer(tile_x, tile_y, zoom, api_key, mode='precipitation'):
-    img_url = f'https://tile.openweathermap.org/map/{mode}/{zoom}/{tile_x}/{tile_y}.png?appid={api_key}'
+def get_weathermap_layer(tile_x, tile_y, zoom, mode='precipitation'):
+    img_url = f'/tiles/{mode}/{zoom}/{tile_x}/{tile_y}.png'
     tile_bounds = get_tile_bounds(tile_x, tile_y, zoom)
 
     return dl.ImageOverlay(url=img_url, bounds=tile_bounds)
 
+'''
+Parses map bounds from the Leaflet bounds property.
+
+Returns ((lat1, lon1), (lat2, lon2)) as floats, or None if the value is missing or malformed.
+'''
+def parse_bounds(bounds_json):
+    try:
+        (lat1, lon1), (lat2, lon2) = bounds_json
+        return (float(lat1), float(lon1)), (float(lat2), float(lon2))
+    except (TypeError, ValueError):
+        return None
+
+'''
+Selects the highest zoom, at most zoom, at which the center and corners span no more than two tiles.
+
+Memoized on quantized inputs, so unchanged bounds skip the computation entirely.
+'''
+@lru_cache(maxsize=1024)
+def get_tile_selection(center, bounds, zoom):
+    (lat1, lon1), (lat2, lon2) = bounds
+    points = [center, (lat1, lon1), (lat1, lon2), (lat2, lon1), (lat2, lon2)]
+    coords = [get_mercator_coords(lat, lon) for lat, lon in points]
+
+    while True:
+        n = 2 ** zoom
+        unique_tiles = sorted(set((int(x * n), int(y * n)) for x, y in coords))
+
+        if len(unique_tiles) <= 2 or zoom == 0:
+            return zoom, tuple(unique_tiles)
+
+        zoom = zoom - 1
+
+'''
+Builds the layer list for a tile selection; memoized alongside get_tile_selection.
+'''
+@lru_cache(maxsize=1024)
+def get_layer_list(tile_zoom, tiles, mode):
+    layers = [dl.TileLayer()]
+    layers.extend(get_weathermap_layer(x, y, tile_zoom, mode) for x, y in tiles)
+    return tuple(layers)
+
 '''
 Class for managing weather map layers.
 '''
 class WeatherMap():
 
-    def __init__(self, center, zoom, bounds, owm_key):
-        self.center = center
+    def __init__(self, center, zoom, bounds, mode='precipitation'):
+        self.center = tuple(round(c, QUANTIZE_DIGITS) for c in center)
         self.zoom = zoom
-        self.bounds = bounds
+        self.bounds = tuple(tuple(round(c, QUANTIZE_DIGITS) for c in corner) for corner in bounds) if bounds else None
+        self.mode = mode
         self.tile_zoom = zoom
-        self.key = owm_key
         self.layers = self.get_layers()
-        
-    def get_layers(self):
-        new_layers = [dl.TileLayer()]
-
-        if not self.bounds:
-            self.layers = new_layers
-        
-        lat1, lon1 = self.bounds[0]
-        lat2, lon2 = self.bounds[1]
-
-        p0 = tuple(self.center)
-        p1 = (lat1, lon1)
-        p2 = (lat1, lon2)
-        p3 = (lat2, lon1)
-        p4 = (lat2, lon2)
 
-        points = [p0, p1, p2, p3, p4]
+    '''Identifies the layer list; equal keys always produce identical layers'''
+    @property
+    def key(self):
+        return f'{self.mode}/{self.tile_zoom}/{self.tiles}'
 
-        while True:
-            tiles = [get_tile_coords(lat, lon, self.tile_zoom) for lat, lon in points]
-            unique_tiles = list(set(tiles))
-
-            if len(unique_tiles) <= 2:
-                break
-            
-            self.tile_zoom = self.tile_zoom - 1
+    def get_layers(self):
+        if not self.bounds:
+            self.tiles = ()
+            return [dl.TileLayer()]
 
-        img_layers = [get_weathermap_layer(x, y, self.tile_zoom, self.key) for x,y in unique_tiles]
-        new_layers.extend(img_layers)
+        self.tile_zoom, self.tiles = get_tile_selection(self.center, self.bounds, self.zoom)
 
-        return new_layers
\ No newline at end of file
+        return list(get_layer_list(self.tile_zoom, self.tiles, self.mode))
\ No newline at end of file
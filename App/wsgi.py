@@ -0,0 +1,7 @@
+from index import app, warm_up
+
+# WSGI entry point for production servers, e.g. gunicorn -c gunicorn.conf.py wsgi:server
+server = app.server
+
+# Under preload_app this runs once in the gunicorn master, otherwise once per worker
+warm_up()
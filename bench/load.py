@@ -0,0 +1,430 @@
+'''
+End-to-end load test: simulated dashboards against the app, with a local mock of every upstream.
+
+Usage: python bench/load.py [--clients N] [--duration S] [--tick S] [--locations M] [--push]
+                            [--latency MS] [--jitter MS] [--error-rate P] [--target URL] [--output FILE]
+
+A mock OpenWeatherMap/ipinfo/tile server with configurable latency and error rate stands in for
+the upstreams. Each client replays a browser session over HTTP: the page load, update_location,
+the initial refresh_page, daily forecast and alert callbacks, the map tiles, and then a
+data-interval tick (with the daily and, less often, alert callbacks) every --tick seconds.
+With --push, each client instead holds an /events stream open as assets/push.js does, running
+the refresh, daily and alert callbacks on every pushed update, and only polls for alerts.
+Callback requests are built from /_dash-dependencies. Reports throughput, p50/p99 latency per
+request kind and upstream calls per client, as JSON on stdout or in --output.
+
+By default the app runs in this process on a threaded development server (sharing the GIL
+with the clients, so throughput is a lower bound). To load a production server instead, start
+the mock with a fixed --mock-port, point OWM_API_URL, OWM_TILE_URL and IPINFO_URL at it, start
+gunicorn, and pass its address as --target.
+'''
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import requests
+import socket
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import offline
+
+'''
+Mock OpenWeatherMap, ipinfo and tile server answering from the benchmark fixtures.
+
+Every response is delayed by latency plus up to jitter seconds, and fails with a 500 at
+error_rate. Requests are counted by kind (onecall, ipinfo, tile).
+'''
+class MockUpstream():
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.transport = offline.FixtureTransport()
+        self.calls = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                mock.handle(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def handle(self, handler):
+        kind, body, content_type = self.transport.route(handler.path.split('?')[0])
+        failed = random.random() < self.error_rate
+
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.errors += failed
+
+        time.sleep(self.latency + random.random()*self.jitter)
+
+        if failed:
+            body, content_type = b'{"cod": 500}', 'application/json'
+
+        handler.send_response(500 if failed else 200)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='mock-upstream', daemon=True).start()
+
+        return self
+
+'''
+Latency samples per request kind, with failure counts.
+'''
+class Stats():
+
+    def __init__(self):
+        self.samples = {}
+        self.failures = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def record(self, kind, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(kind, []).append(seconds)
+
+            if not ok:
+                self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def summary(self, duration):
+        def describe(samples, failures):
+            samples = sorted(samples)
+
+            def percentile(q):
+                return samples[min(len(samples) - 1, int(q*len(samples)))] if samples else None
+
+            return dict(
+                requests = len(samples),
+                failures = failures,
+                throughput = len(samples) / duration,
+                p50 = percentile(0.50),
+                p99 = percentile(0.99),
+                max = samples[-1] if samples else None,
+            )
+
+        with self._lock:
+            kinds = {kind: describe(samples, self.failures.get(kind, 0)) for kind, samples in sorted(self.samples.items())}
+            total = describe([s for samples in self.samples.values() for s in samples], sum(self.failures.values()))
+
+        return total, kinds
+
+'''
+requests-based stand-in for the Flask test client, so DashClient can drive a live server.
+'''
+class HttpClient():
+
+    def __init__(self, base):
+        self.base = base
+        self.session = requests.Session()
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault('timeout', 60)
+        return self.session.get(self.base + path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session.post(self.base + path, timeout=60, **kwargs)
+
+'''Return the output of every callback with an input on component id'''
+def outputs_for_input(dependencies, id):
+    return [d['output'].strip('.').split('...')[0] for d in dependencies if any(i['id'] == id for i in d['inputs'])]
+
+'''Return the /tiles/ URLs found anywhere in a serialized component tree'''
+def tile_urls(tree):
+    if isinstance(tree, dict):
+        return [url for value in tree.values() for url in tile_urls(value)]
+    if isinstance(tree, list):
+        return [url for value in tree for url in tile_urls(value)]
+    if isinstance(tree, str) and tree.startswith('/tiles/'):
+        return [tree]
+
+    return []
+
+'''
+One simulated dashboard, replaying the callback traffic of a browser tab.
+'''
+class Browser():
+
+    # Ticks between emergency alert polls (thirty minutes of five-minute data ticks)
+    ALERT_EVERY = 6
+
+    # Seconds before reconnecting a dropped event stream, as the server's retry field asks
+    RETRY = 10
+
+    def __init__(self, base, dependencies, location, stats, push=False):
+        self.http = HttpClient(base)
+        self.events = HttpClient(base)
+        self.push = push
+        self.stream = None
+        self.dash = offline.DashClient(self.http, dependencies)
+        self.daily_outputs = outputs_for_input(dependencies, 'daily-forecast')
+        self.stats = stats
+        self.values = {
+            'url.pathname': '/',
+            'data-interval.n_intervals': 0,
+            'thirty-minute-interval.n_intervals': 0,
+            'map.bounds': [[location['lat'] - 0.05, location['lon'] - 0.1], [location['lat'] + 0.05, location['lon'] + 0.1]],
+        }
+        self.location = location['location']
+
+    def timed(self, kind, request):
+        start = time.perf_counter()
+
+        try:
+            response = request()
+            ok = response.status_code in (200, 204, 304)
+        except requests.RequestException:
+            response, ok = None, False
+
+        self.stats.record(kind, time.perf_counter() - start, ok)
+
+        return response if ok else None
+
+    '''Call the callback producing output, merging the outputs it returns into the browser state'''
+    def callback(self, kind, output, changed):
+        response = self.timed(kind, lambda: self.dash.call(output, self.values, [changed]))
+
+        if response is None or response.status_code == 204:
+            return {}
+
+        updates = response.json()['response']
+
+        for id, props in updates.items():
+            for property, value in props.items():
+                self.values[f'{id}.{property}'] = value
+
+        return updates
+
+    def load_page(self):
+        self.timed('page', lambda: self.http.get('/'))
+        self.timed('layout', lambda: self.http.get('/_dash-layout'))
+
+        self.callback('update_location', 'memory-output.data', 'url.pathname')
+        # Stand in for a client at this session's location
+        self.values['memory-output.data'] = self.location
+
+        updates = self.callback('refresh_page', 'data-version.data', 'url.pathname')
+        # As in the browser, the daily outputs only run when the daily store changes
+        if self.callback('update_daily_forecast', 'daily-forecast.data', 'memory-output.data'):
+            self.daily()
+        self.callback('update_emergency_alert', 'emergency-alert.children', 'memory-output.data')
+
+        for url in tile_urls(updates.get('map', {})):
+            self.timed('tile', lambda: self.http.get(url))
+
+    def daily(self):
+        for output in self.daily_outputs:
+            self.callback('daily_outputs', output, 'daily-forecast.data')
+
+    def tick(self, n):
+        # push.js disables data-interval while its event stream is connected
+        if not self.push:
+            self.values['data-interval.n_intervals'] = n
+            self.callback('refresh_page_tick', 'data-version.data', 'data-interval.n_intervals')
+
+            if self.callback('update_daily_forecast_tick', 'daily-forecast.data', 'data-interval.n_intervals'):
+                self.daily()
+
+        if n % self.ALERT_EVERY == 0:
+            self.values['thirty-minute-interval.n_intervals'] = n // self.ALERT_EVERY
+            self.callback('update_emergency_alert_tick', 'emergency-alert.children', 'thirty-minute-interval.n_intervals')
+
+    '''Run the callbacks a pushed data version triggers'''
+    def update(self, version):
+        self.values['push-version.data'] = version
+        self.callback('refresh_page_push', 'data-version.data', 'push-version.data')
+
+        if self.callback('update_daily_forecast_push', 'daily-forecast.data', 'push-version.data'):
+            self.daily()
+
+        self.callback('update_emergency_alert_push', 'emergency-alert.children', 'push-version.data')
+
+    '''Hold the /events stream open until stop, reconnecting after RETRY seconds when it drops'''
+    def listen(self, stop):
+        while not stop.is_set():
+            # The read timeout only has to outlast the server's heartbeats
+            response = self.timed('stream', lambda: self.events.get('/events', stream=True, timeout=(10, 60)))
+
+            if response is None:
+                stop.wait(self.RETRY)
+                continue
+
+            self.stream = response
+            self.stats.count('streams_opened')
+            event = None
+
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('event: '):
+                        event = line[len('event: '):]
+                    elif line.startswith('data: ') and event == 'update':
+                        if stop.is_set():
+                            break
+
+                        self.stats.count('updates_received')
+                        self.update(line[len('data: '):])
+                    elif not line:
+                        event = None
+            # Dropped by the server, or closed by close() at the end of the run
+            except Exception:
+                pass
+            finally:
+                response.close()
+
+            if not stop.is_set():
+                self.stats.count('streams_dropped')
+                stop.wait(self.RETRY)
+
+    '''Drop the event stream, waking a listen() blocked reading it'''
+    def close(self):
+        stream = self.stream
+        connection = getattr(stream.raw, 'connection', None) if stream is not None else None
+        sock = getattr(connection, 'sock', None)
+
+        # Closing the response itself would wait for the reading thread to let go of it
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self, tick, stop):
+        self.load_page()
+
+        if self.push:
+            threading.Thread(target=self.listen, args=(stop,), daemon=True).start()
+
+        n = 0
+
+        # Start ticking at a random phase, as real tabs are not opened in lockstep
+        while not stop.wait(tick if n else random.random()*tick):
+            n += 1
+            self.tick(n)
+
+'''Return session locations drawn from the fixture cities, as (ipinfo-style location, lat, lon)'''
+def load_locations(count):
+    with open(os.path.join(offline.FIXTURES, 'cities.csv'), newline='') as f:
+        cities = list(csv.DictReader(f))
+
+    random.Random(0).shuffle(cities)
+    locations = []
+
+    for city in cities[:count]:
+        lat, lon = float(city['lat']), float(city['lon'])
+        location = {'city': city['name'], 'region': city['state'], 'country': city['country'], 'timezone': 'America/New_York', 'loc': f'{lat},{lon}'}
+        locations.append(dict(location=location, lat=lat, lon=lon))
+
+    return locations
+
+'''Start the app on a threaded development server in this process, returning its base URL'''
+def serve_app(mock, push=False, tick=5):
+    # Updates are checked for once per tick, as the data interval is compressed
+    os.environ.update(OWM_API_URL=mock.url, OWM_TILE_URL=mock.url, IPINFO_URL=mock.url, PUSH_INTERVAL=str(tick))
+    offline.setup(transport=False, push=push)
+
+    import index
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, index.app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, name='app-server', daemon=True).start()
+
+    return f'http://127.0.0.1:{server.server_port}'
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app against mock upstreams.')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent simulated dashboards')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run after the first page loads start')
+    parser.add_argument('--tick', type=float, default=5, help='seconds between data-interval ticks per client (compressed from five minutes)')
+    parser.add_argument('--locations', type=int, default=10, help='distinct client locations')
+    parser.add_argument('--push', action='store_true', help='hold an /events stream open per client and refresh on pushed updates instead of ticks')
+    parser.add_argument('--latency', type=float, default=50, help='mock upstream latency in milliseconds')
+    parser.add_argument('--jitter', type=float, default=50, help='extra random mock latency, up to this many milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock upstream requests that fail with a 500')
+    parser.add_argument('--mock-port', type=int, default=0, help='port for the mock upstream server')
+    parser.add_argument('--target', help='base URL of an already running app to load instead of an in-process server')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    mock = MockUpstream(args.mock_port, args.latency/1000, args.jitter/1000, args.error_rate).start()
+    base = args.target or serve_app(mock, args.push, args.tick)
+
+    dependencies = requests.get(base + '/_dash-dependencies', timeout=60).json()
+    locations = load_locations(args.locations)
+    stats = Stats()
+    stop = threading.Event()
+
+    browsers = [Browser(base, dependencies, locations[i % len(locations)], stats, args.push) for i in range(args.clients)]
+    threads = [threading.Thread(target=browser.run, args=(args.tick, stop), daemon=True) for browser in browsers]
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.duration)
+    stop.set()
+
+    for browser in browsers:
+        browser.close()
+
+    for thread in threads:
+        thread.join(timeout=60)
+
+    duration = time.perf_counter() - start
+    total, kinds = stats.summary(duration)
+    upstream = dict(mock.calls)
+
+    report = dict(
+        config = vars(args),
+        duration = duration,
+        total = total,
+        requests = kinds,
+        push = dict(stats.counts) if args.push else None,
+        upstream = dict(
+            calls = upstream,
+            errors = mock.errors,
+            per_client = {kind: count / args.clients for kind, count in upstream.items()},
+            per_location = {kind: count / min(args.locations, len(locations)) for kind, count in upstream.items()},
+        ),
+    )
+
+    print(f'{total["requests"]} requests in {duration:.1f}s: {total["throughput"]:.1f}/s, '
+          f'p50 {1000*(total["p50"] or 0):.1f} ms, p99 {1000*(total["p99"] or 0):.1f} ms, {total["failures"]} failed; '
+          f'upstream {upstream}' + (f'; push {stats.counts}' if args.push else ''), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from urllib.parse import urlsplit
+from urllib3 import HTTPResponse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'App')
+FIXTURES = os.path.join(BENCH_DIR, 'fixtures')
+
+# Smallest valid PNG (1x1, transparent), served for every map tile
+TILE_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082'
+)
+
+'''
+Load a fixture file as bytes.
+'''
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+'''
+requests transport adapter that answers every upstream call from the fixtures.
+
+One Call requests get fixtures/onecall.json, ipinfo lookups get fixtures/ipinfo.json with the
+requested address filled in, and map tiles get a 1x1 PNG. Calls are counted by kind.
+'''
+class FixtureTransport(BaseAdapter):
+
+    def __init__(self):
+        super().__init__()
+        self.onecall = load_fixture('onecall.json')
+        self.ipinfo = json.loads(load_fixture('ipinfo.json'))
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def route(self, path):
+        if path.startswith('/data/'):
+            return 'onecall', self.onecall, 'application/json'
+
+        if path.startswith('/map/'):
+            return 'tile', TILE_PNG, 'image/png'
+
+        return 'ipinfo', json.dumps(dict(self.ipinfo, ip=path.strip('/'))).encode(), 'application/json'
+
+    def send(self, request, **kwargs):
+        kind, body, content_type = self.route(urlsplit(request.url).path)
+
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+        response = Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = content_type
+        response.headers['Content-Length'] = str(len(body))
+        response.raw = HTTPResponse(body=io.BytesIO(body), headers=dict(response.headers), status=200, preload_content=False)
+        response.url = request.url
+        response.request = request
+
+        return response
+
+    def close(self):
+        pass
+
+'''
+Stand-in for the pyowm city registry, holding the cities in fixtures/cities.csv.
+'''
+class FixtureRegistry():
+
+    def __init__(self):
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.connection.execute('CREATE TABLE city (city_id INTEGER, name TEXT, country TEXT, state TEXT, lat REAL, lon REAL)')
+
+        with open(os.path.join(FIXTURES, 'cities.csv'), newline='') as f:
+            rows = [tuple(row.values()) for row in csv.DictReader(f)]
+
+        self.connection.executemany('INSERT INTO city VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+'''Prepare this process to import the app with no network access
+
+Works from a temporary directory holding placeholder API keys, keeps caches per process and
+turns off server push unless push. With transport, every upstream session is answered by a
+FixtureTransport, which is returned; otherwise upstream calls go to the UPSTREAMS base URLs
+(e.g. a local mock)
+'''
+def setup(transport=True, push=False):
+    for name in ('SHARED_CACHE_PATH', 'GEOIP_DB'):
+        os.environ.pop(name, None)
+
+    work = tempfile.mkdtemp(prefix='weather-bench-')
+    os.makedirs(os.path.join(work, 'api_keys'))
+
+    for name in ('owm_key.txt', 'ipinfo-key.txt'):
+        with open(os.path.join(work, 'api_keys', name), 'w') as f:
+            f.write('bench')
+
+    os.environ['TILE_CACHE_DIR'] = os.path.join(work, 'tiles')
+    os.environ['PUSH_UPDATES'] = '1' if push else '0'
+    os.chdir(work)
+
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+    import http_client
+    import forecast_manager
+
+    if transport:
+        transport = FixtureTransport()
+
+        for upstream in http_client.UPSTREAMS:
+            session = http_client.get_session(upstream)
+            session.mount('http://', transport)
+            session.mount('https://', transport)
+
+    registry = FixtureRegistry()
+    forecast_manager.ForecastManager.city_registry = lambda self: registry
+
+    return transport
+
+'''
+Client for calling Dash callbacks the way the browser does, through /_dash-update-component.
+
+Requests are built from the app's /_dash-dependencies, so they track the callback signatures.
+client is a Flask test client or anything with the same get/post calls (given dependencies).
+'''
+class DashClient():
+
+    def __init__(self, client, dependencies=None):
+        self.client = client
+        self.dependencies = dependencies or client.get('/_dash-dependencies').get_json()
+
+    '''Return the dependency entry of the callback whose output includes output (e.g. 'icon.src')'''
+    def callback(self, output):
+        for dependency in self.dependencies:
+            if output in dependency['output'].strip('.').split('...'):
+                return dependency
+
+        raise KeyError(output)
+
+    '''Return the request body for a callback, taking input and state values from values
+
+    values maps 'id.property' to a value; anything not given is None. changed names the
+    triggering inputs (default: the first input)
+    '''
+    def body(self, output, values, changed=None):
+        dependency = self.callback(output)
+        multi = dependency['output'].startswith('..')
+        outputs = []
+
+        for spec in dependency['output'].strip('.').split('...'):
+            id, property = spec.rsplit('.', 1)
+            outputs.append({'id': id, 'property': property})
+
+        def fill(specs):
+            return [dict(spec, value=values.get(f'{spec["id"]}.{spec["property"]}')) for spec in specs]
+
+        inputs = fill(dependency['inputs'])
+
+        return {
+            'output': dependency['output'],
+            'outputs': outputs if multi else outputs[0],
+            'inputs': inputs,
+            'state': fill(dependency['state']),
+            'changedPropIds': changed or [f'{inputs[0]["id"]}.{inputs[0]["property"]}'],
+        }
+
+    def post(self, body, **kwargs):
+        return self.client.post('/_dash-update-component', json=body, **kwargs)
+
+    def call(self, output, values, changed=None, **kwargs):
+        return self.post(self.body(output, values, changed), **kwargs)
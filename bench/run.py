@@ -0,0 +1,173 @@
+'''
+Offline micro-benchmarks for the forecast, plotting, map and callback hot paths.
+
+Usage: python bench/run.py [--repeat N] [--filter TEXT] [--output FILE]
+
+Every upstream call is answered from bench/fixtures, so results depend only on the code and
+the machine. Each benchmark reports per-call wall and CPU time (minimum and median over
+--repeat rounds) and the bytes allocated by one call, as JSON on stdout or in --output.
+'''
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import offline
+
+'''Return the number of calls per round that makes a round last at least target seconds'''
+def calibrate(func, target=0.05):
+    number = 1
+
+    while True:
+        start = time.perf_counter()
+
+        for _ in range(number):
+            func()
+
+        if time.perf_counter() - start >= target or number >= 1 << 20:
+            return number
+
+        number *= 2
+
+'''Time func, returning per-call wall and CPU seconds and the allocations of a single call'''
+def measure(func, repeat):
+    func()
+    number = calibrate(func)
+    walls, cpus = [], []
+
+    gc.collect()
+    gc.disable()
+
+    try:
+        for _ in range(repeat):
+            wall, cpu = time.perf_counter(), time.process_time()
+
+            for _ in range(number):
+                func()
+
+            walls.append((time.perf_counter() - wall) / number)
+            cpus.append((time.process_time() - cpu) / number)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+
+    try:
+        func()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(
+        number = number,
+        repeat = repeat,
+        wall_min = min(walls),
+        wall_median = statistics.median(walls),
+        cpu_min = min(cpus),
+        cpu_median = statistics.median(cpus),
+        alloc_peak_bytes = peak - before,
+        alloc_retained_bytes = after - before,
+    )
+
+'''Return the benchmarks as (name, func) pairs, with every cache they read already warm'''
+def benchmarks():
+    transport = offline.setup()
+
+    import weather_map
+
+    from app import app
+    from callbacks import MGR, STATES
+    from forecast_plotter import ForecastPlotter
+    from forecast_record import ForecastRecord
+    from layout import layout_function
+
+    app.layout = layout_function
+
+    location = json.loads(offline.load_fixture('ipinfo.json'))
+    payload = json.loads(offline.load_fixture('onecall.json'))
+
+    bundle = MGR.get_bundle(location, STATES)
+    onecall, timezone = bundle['onecall'], bundle['timezone']
+    plotter = ForecastPlotter(bundle['forecast'])
+
+    center = (bundle['lat'], bundle['lon'])
+    bounds = weather_map.parse_bounds([[39.70, -84.30], [39.80, -84.10]])
+
+    def map_layers_cold():
+        weather_map.get_tile_selection.cache_clear()
+        weather_map.get_layer_list.cache_clear()
+        return weather_map.WeatherMap(center, 11, bounds).layers
+
+    client = offline.DashClient(app.server.test_client())
+    refresh = client.body('icon.src', {
+        'url.pathname': '/',
+        'memory-output.data': location,
+        'map.bounds': [[39.70, -84.30], [39.80, -84.10]],
+    })
+
+    def refresh_page():
+        response = client.post(refresh)
+        assert response.status_code == 200, response.status_code
+
+    yield 'record.from_onecall', lambda: ForecastRecord.from_onecall(payload, 'bench')
+    yield 'manager.get_weather_fmt', lambda: MGR.get_weather_fmt(onecall)
+    yield 'manager.get_forecast', lambda: MGR.get_forecast(onecall, timezone)
+    yield 'manager.get_daily_forecast', lambda: MGR.get_daily_forecast(onecall, timezone)
+    yield 'manager.get_emergency_alerts', lambda: MGR.get_emergency_alerts(onecall, timezone)
+    yield 'manager.get_bundle', lambda: MGR.get_bundle(location, STATES)
+    yield 'plotter.plot_temp_forecast', plotter.plot_temp_forecast
+    yield 'plotter.plot_precip_forecast', plotter.plot_precip_forecast
+    yield 'plotter.plot_humid_forecast', plotter.plot_humid_forecast
+    yield 'plotter.patch', lambda: [plotter.patch(kind) for kind in ('temp', 'precip', 'humid')]
+    yield 'weather_map.layers', lambda: weather_map.WeatherMap(center, 11, bounds).layers
+    yield 'weather_map.layers_cold', map_layers_cold
+    yield 'callback.refresh_page', refresh_page
+
+    # Everything above must have been served from the warm caches
+    assert transport.calls.get('onecall', 0) <= 1, transport.calls
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=offline.BENCH_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline micro-benchmarks.')
+    parser.add_argument('--repeat', type=int, default=7, help='timed rounds per benchmark')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = []
+
+    for name, func in benchmarks():
+        if args.filter in name:
+            results.append(dict(name=name, **measure(func, args.repeat)))
+            print(f'{name:32} {1e6*results[-1]["wall_median"]:12.1f} us', file=sys.stderr)
+
+    report = dict(
+        revision = revision(),
+        python = platform.python_version(),
+        platform = platform.platform(),
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        results = results,
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
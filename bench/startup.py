@@ -0,0 +1,157 @@
+'''
+Cold-start benchmark: import, warm-up and first-request times of the app in fresh processes.
+
+Usage: python bench/startup.py [--repeat N] [--budget-import S] [--budget-first-request S]
+                               [--top N] [--output FILE]
+
+Each round starts a new interpreter that imports the app (index.py, including the offline
+fixture setup), runs wsgi.py's warm-up and starts the background threads, then serves the
+requests a browser makes to show a dashboard: the page, the layout, the callback dependencies
+and the first refresh_page callback. Upstream calls are answered from bench/fixtures. One more
+run under -X importtime lists the modules that take longest to import.
+
+Reports the median and worst time of every phase as JSON on stdout or in --output, and exits
+with status 1 if the median import (import plus warm-up) or first-request time exceeds its
+budget, so cold starts can be held under a budget in CI.
+'''
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import offline
+
+# Phases of one cold start, in order; the first two count against the import budget
+PHASES = ('import', 'warm_up', 'start', 'page', 'layout', 'dependencies', 'refresh_page')
+
+'''Run one cold start in this (fresh) process, printing the seconds of each phase as JSON'''
+def child():
+    times = {}
+
+    def phase(name, func):
+        start = time.perf_counter()
+        result = func()
+        times[name] = time.perf_counter() - start
+
+        return result
+
+    def import_app():
+        offline.setup()
+
+        import index
+
+        return index
+
+    index = phase('import', import_app)
+    phase('warm_up', index.warm_up)
+    phase('start', index.start)
+
+    client = index.app.server.test_client()
+    location = json.loads(offline.load_fixture('ipinfo.json'))
+
+    def check(response):
+        assert response.status_code == 200, response.status_code
+        return response
+
+    phase('page', lambda: check(client.get('/')))
+    phase('layout', lambda: check(client.get('/_dash-layout')))
+    dash = phase('dependencies', lambda: offline.DashClient(client))
+    phase('refresh_page', lambda: check(dash.call('icon.src', {
+        'url.pathname': '/',
+        'memory-output.data': location,
+        'map.bounds': [[39.70, -84.30], [39.80, -84.10]],
+    })))
+
+    json.dump(times, sys.stdout)
+
+'''Run one cold start in a new interpreter, returning its phase times and total process time'''
+def cold_start():
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, __file__, '--child'], capture_output=True, text=True, check=True)
+    times = json.loads(result.stdout)
+    times['process'] = time.perf_counter() - start
+
+    return times
+
+'''Return the n modules with the longest self import time, from one run under -X importtime'''
+def slowest_imports(n):
+    result = subprocess.run([sys.executable, '-X', 'importtime', __file__, '--child'], capture_output=True, text=True, check=True)
+    modules = []
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append(dict(module=name.strip(), self=int(own)/1e6, cumulative=int(cumulative)/1e6))
+
+    return sorted(modules, key=lambda module: module['self'], reverse=True)[:n]
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=offline.BENCH_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app cold-start time against a budget.')
+    parser.add_argument('--repeat', type=int, default=5, help='cold starts to measure')
+    parser.add_argument('--budget-import', type=float, default=2.0, help='seconds allowed for import plus warm-up (median)')
+    parser.add_argument('--budget-first-request', type=float, default=1.0, help='seconds allowed from start to the first refresh_page response (median)')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child()
+
+    runs = []
+
+    for _ in range(args.repeat):
+        runs.append(cold_start())
+        runs[-1]['import_total'] = runs[-1]['import'] + runs[-1]['warm_up']
+        runs[-1]['first_request'] = sum(runs[-1][name] for name in PHASES[2:])
+
+    phases = {
+        name: dict(median=statistics.median(run[name] for run in runs), max=max(run[name] for run in runs))
+        for name in PHASES + ('import_total', 'first_request', 'process')
+    }
+
+    budgets = {
+        'import_total': args.budget_import,
+        'first_request': args.budget_first_request,
+    }
+    exceeded = [name for name, budget in budgets.items() if phases[name]['median'] > budget]
+
+    for name, phase in phases.items():
+        print(f'{name:16} {1000*phase["median"]:10.1f} ms  (max {1000*phase["max"]:.1f} ms)', file=sys.stderr)
+
+    for name in exceeded:
+        print(f'{name} over budget: {phases[name]["median"]:.3f}s > {budgets[name]:.3f}s', file=sys.stderr)
+
+    report = dict(
+        revision = revision(),
+        python = platform.python_version(),
+        platform = platform.platform(),
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        phases = phases,
+        budgets = budgets,
+        exceeded = exceeded,
+        slowest_imports = slowest_imports(args.top) if args.top else [],
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 1 if exceeded else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# The app modules import each other as top-level modules from App/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'App'))
+
+# Modules that load configuration at import read placeholder API keys from the working directory,
+# and keep their caches in this process
+WORK_DIR = tempfile.mkdtemp(prefix='weather-tests-')
+os.makedirs(os.path.join(WORK_DIR, 'api_keys'))
+
+for name in ('owm_key.txt', 'ipinfo-key.txt'):
+    with open(os.path.join(WORK_DIR, 'api_keys', name), 'w') as f:
+        f.write('test')
+
+for name in ('SHARED_CACHE_PATH', 'GEOIP_DB'):
+    os.environ.pop(name, None)
+
+os.environ['TILE_CACHE_DIR'] = os.path.join(WORK_DIR, 'tiles')
+os.environ['PUSH_UPDATES'] = '0'
+os.chdir(WORK_DIR)
@@ -0,0 +1,133 @@
+import threading
+import time
+import unittest.mock
+
+import pytest
+
+from cache import TTLCache
+from shared_cache import SharedCache
+
+CALLERS = 50
+
+'''Call func from CALLERS threads released at once, returning each thread's result or exception'''
+def run_concurrently(func):
+    barrier = threading.Barrier(CALLERS)
+    results = [None]*CALLERS
+
+    def run(i):
+        barrier.wait()
+
+        try:
+            results[i] = func()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(CALLERS)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join(timeout=10)
+
+    return results
+
+'''Return a slow fetch that counts its calls, returning value or raising error'''
+def slow_fetch(value=None, error=None):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+
+        if error is not None:
+            raise error
+
+        return value
+
+    return fetch, calls
+
+def test_concurrent_misses_fetch_once():
+    cache = TTLCache(60)
+    fetch, calls = slow_fetch(value={'temp': 280})
+
+    results = run_concurrently(lambda: cache.get_or_fetch('dayton', fetch))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache.get('dayton') == {'temp': 280}
+
+def test_fetch_error_reaches_every_waiter():
+    cache = TTLCache(60)
+    error = RuntimeError('upstream down')
+    fetch, calls = slow_fetch(error=error)
+
+    results = run_concurrently(lambda: cache.get_or_fetch('dayton', fetch))
+
+    assert len(calls) == 1
+    assert all(result is error for result in results)
+    assert cache.get('dayton') is None
+
+def test_failed_fetch_is_retried_by_the_next_caller():
+    cache = TTLCache(60)
+    failing, _ = slow_fetch(error=RuntimeError('upstream down'))
+    fetch, calls = slow_fetch(value=1)
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_fetch('dayton', failing)
+
+    assert cache.get_or_fetch('dayton', fetch) == 1
+    assert len(calls) == 1
+
+def test_distinct_keys_fetch_independently():
+    cache = TTLCache(60)
+    counter = iter(range(CALLERS))
+    lock = threading.Lock()
+
+    def key():
+        with lock:
+            return next(counter)
+
+    fetch, calls = slow_fetch(value=1)
+    results = run_concurrently(lambda: cache.get_or_fetch(key(), fetch))
+
+    assert results == [1]*CALLERS
+    assert len(calls) == CALLERS
+
+def test_miss_during_refresh_gets_the_refreshed_value():
+    cache = TTLCache(60)
+    fetch, calls = slow_fetch(value={'temp': 280})
+    refresher = threading.Thread(target=cache.refresh, args=('dayton', fetch, 90))
+    refresher.start()
+    time.sleep(0.05)
+
+    # Joins the prefetch already in flight for the missing key
+    assert cache.get_or_fetch('dayton', fetch) == {'temp': 280}
+
+    refresher.join()
+    assert len(calls) == 1
+
+def test_miss_during_refresh_of_a_leased_key_waits_for_the_holder(tmp_path):
+    shared = SharedCache(str(tmp_path / 'cache.sqlite3'))
+    cache = TTLCache(60, shared=shared, namespace='test')
+    fetch, calls = slow_fetch(value=2)
+
+    # Another process holds the lease and stores its result shortly
+    assert shared.acquire('test', 'dayton', TTLCache.LEASE_TTL)
+    holder = threading.Timer(0.2, shared.set, args=('test', 'dayton', 1, 60))
+    holder.start()
+    refresher = threading.Thread(target=cache.refresh, args=('dayton', fetch, 90))
+
+    def acquire(*args):
+        time.sleep(0.1)
+        return False
+
+    with unittest.mock.patch.object(shared, 'acquire', acquire):
+        refresher.start()
+        time.sleep(0.05)
+
+        assert cache.get_or_fetch('dayton', fetch) == 1
+
+    refresher.join()
+    holder.join()
+    assert calls == []
@@ -0,0 +1,50 @@
+import pytest
+
+import callbacks
+
+from dash.exceptions import PreventUpdate
+from forecast_manager import ForecastManager
+from forecast_record import ForecastRecord
+
+LOCATION = {'city': 'Dayton', 'region': 'Ohio', 'country': 'US', 'timezone': 'America/New_York', 'loc': '39.7589,-84.1916'}
+
+ALERTS = [
+    {'sender_name': 'NWS Wilmington OH', 'event': 'Flood Watch', 'start': 1700000000, 'end': 1700036000, 'description': 'Heavy rain.'},
+    {'sender_name': 'NWS Wilmington OH', 'event': 'Wind Advisory', 'start': 1700010000, 'end': 1700020000, 'description': 'Gusts to 50 mph.'},
+]
+
+'''Serve bundles whose alerts come from a minimal One Call response carrying alerts'''
+@pytest.fixture
+def alerts(monkeypatch):
+    def serve(alerts, version):
+        record = ForecastRecord.from_onecall({'current': {'temp': 280, 'humidity': 50}, 'alerts': alerts}, version)
+        bundle = dict(alerts=ForecastManager(LOCATION, 'test').get_emergency_alerts(record, 'America/New_York'))
+        monkeypatch.setattr(callbacks.MGR, 'get_bundle', lambda location, states: bundle)
+
+    monkeypatch.setattr(callbacks.SCHEDULER, 'touch', lambda location: None)
+
+    return serve
+
+def test_every_alert_is_shown(alerts):
+    alerts(ALERTS, 'shown')
+
+    style, message, tabs_style, key = callbacks.update_emergency_alert(0, None, LOCATION, None)
+
+    assert style == callbacks.ALERT_STYLE
+    assert tabs_style == callbacks.TABS_ALERT_STYLE
+    assert 'Flood Watch' in message and 'Wind Advisory' in message
+    assert 'Heavy rain.' in message and 'Gusts to 50 mph.' in message
+
+def test_unchanged_alerts_are_not_sent_again(alerts):
+    alerts(ALERTS, 'unchanged-1')
+    key = callbacks.update_emergency_alert(0, None, LOCATION, None)[3]
+
+    # A newer upstream response with the same alerts
+    alerts(ALERTS, 'unchanged-2')
+
+    with pytest.raises(PreventUpdate):
+        callbacks.update_emergency_alert(1, None, LOCATION, key)
+
+    alerts([], 'unchanged-3')
+
+    assert callbacks.update_emergency_alert(2, None, LOCATION, key) == (callbacks.HIDDEN_ALERT_STYLE, '', callbacks.TABS_STYLE, callbacks.MGR.get_bundle(LOCATION, {})['alerts']['key'])
@@ -0,0 +1,66 @@
+import sqlite3
+import threading
+
+import pytest
+
+import city_index
+
+from city_index import CityIndex, get_city_index
+
+CITIES = [
+    (1, 'Dayton', 'US', 'OH', 39.7589, -84.1916),
+    (2, 'Kettering', 'US', 'OH', 39.6895, -84.1688),
+    (3, 'Dayton', 'US', 'TX', 30.0469, -94.8852),
+    (4, 'Columbus', 'US', 'OH', 39.9612, -82.9988),
+]
+
+'''Stand-in for the pyowm registry: an in-memory SQLite city table, usable only on this thread'''
+class Registry():
+
+    def __init__(self):
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.execute('CREATE TABLE city (city_id INTEGER, name TEXT, country TEXT, state TEXT, lat REAL, lon REAL)')
+        self.connection.executemany('INSERT INTO city VALUES (?, ?, ?, ?, ?, ?)', CITIES)
+
+def test_nearest_city():
+    index = CityIndex(CITIES)
+
+    assert index.nearest(39.70, -84.17)[0] == 2
+    assert index.nearest(39.76, -84.19)[0] == 1
+    assert index.nearest(-33.9, 151.2) is None
+
+def test_find_by_name():
+    index = CityIndex(CITIES)
+
+    assert index.find('dayton', 'US', 'TX')[0] == 3
+    assert index.find('Dayton', 'US')[0] in (1, 3)
+    assert index.find('Dayton', 'US', 'CA') is None
+
+def test_index_built_from_registry_serves_other_threads():
+    index = CityIndex.from_registry(Registry())
+    results = []
+
+    thread = threading.Thread(target=lambda: results.append((index.find('Columbus', 'US', 'OH'), index.nearest(39.96, -83.0))))
+    thread.start()
+    thread.join()
+
+    assert results[0][0][0] == 4
+    assert results[0][1][0] == 4
+
+def test_failed_build_is_not_retried_until_back_off(monkeypatch):
+    monkeypatch.setattr(city_index, '_INDEX', None)
+    monkeypatch.setattr(city_index, '_FAILURE', None)
+    calls = []
+
+    def load_registry():
+        calls.append(1)
+        raise TypeError("'pyowm.commons.cityidregistry' is not a package")
+
+    for _ in range(3):
+        with pytest.raises(Exception):
+            get_city_index(load_registry)
+
+    assert len(calls) == 1
+
+    monkeypatch.setattr(city_index, 'RETRY_AFTER', 0)
+    assert len(get_city_index(Registry)) == len(CITIES)
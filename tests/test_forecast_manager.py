@@ -0,0 +1,48 @@
+import city_index
+
+from forecast_manager import ForecastManager
+from forecast_record import ForecastRecord
+
+LOCATION = {'city': 'Springfield', 'region': 'Ohio', 'country': 'US', 'timezone': 'America/New_York', 'loc': '39.9242,-83.8088'}
+
+STATES = {'Ohio': 'OH'}
+
+def test_location_resolves_from_ipinfo_without_the_city_index(monkeypatch):
+    monkeypatch.setattr(city_index, '_INDEX', None)
+    monkeypatch.setattr(city_index, '_FAILURE', None)
+    mgr = ForecastManager(LOCATION, 'test')
+
+    def city_registry():
+        raise TypeError("'pyowm.commons.cityidregistry' is not a package")
+
+    monkeypatch.setattr(mgr, 'city_registry', city_registry)
+
+    assert mgr.nearest_city(39.92, -83.81) is None
+    assert mgr.resolve_location(LOCATION, STATES) == ('Springfield', 'Ohio', 'US', 'America/New_York', 39.9242, -83.8088)
+
+ALERTS = [
+    {'sender_name': 'NWS Wilmington OH', 'event': 'Flood Watch', 'start': 1700000000, 'end': 1700036000, 'description': 'Heavy rain.'},
+    {'sender_name': 'NWS Wilmington OH', 'event': 'Wind Advisory', 'start': 1700010000, 'end': 1700020000, 'description': 'Gusts to 50 mph.'},
+]
+
+'''Return a ForecastRecord for a minimal One Call response carrying alerts'''
+def onecall(alerts, version):
+    return ForecastRecord.from_onecall({'current': {'temp': 280, 'humidity': 50}, 'alerts': alerts}, version)
+
+def test_every_alert_is_kept():
+    alerts = ForecastManager(LOCATION, 'test').get_emergency_alerts(onecall(ALERTS, 'every'), 'America/New_York')
+
+    assert [alert['event'] for alert in alerts['alerts']] == ['Flood Watch', 'Wind Advisory']
+    assert alerts['alerts'][0]['start'] == '05:13 PM'
+
+def test_alert_key_changes_only_with_the_alerts_or_timezone():
+    mgr = ForecastManager(LOCATION, 'test')
+
+    def key(alerts, version, timezone_name='America/New_York'):
+        return mgr.get_emergency_alerts(onecall(alerts, version), timezone_name)['key']
+
+    # Stable across upstream responses carrying the same alerts
+    assert key(ALERTS, 'key-1') == key(ALERTS, 'key-2')
+    assert key(ALERTS, 'key-1') != key(ALERTS[:1], 'key-3')
+    assert key(ALERTS, 'key-1') != key(ALERTS, 'key-1', 'America/Chicago')
+    assert key([], 'key-4') != key(ALERTS, 'key-1')
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+
+from resilience import DeadlineExceeded
+
+'''Start a local server that sends headers after header_delay seconds, then body in pieces every body_delay seconds'''
+def serve(header_delay, body_delay, pieces=3, protocol='HTTP/1.0'):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = protocol
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(header_delay)
+            self.send_response(200)
+            self.send_header('Content-Length', str(pieces))
+            self.end_headers()
+            self.wfile.flush()
+
+            try:
+                for _ in range(pieces):
+                    time.sleep(body_delay)
+                    self.wfile.write(b'x')
+                    self.wfile.flush()
+            except OSError:
+                pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+def test_fetch_reads_the_whole_body(session):
+    server, url = serve(0, 0.01)
+
+    try:
+        assert http_client.fetch(session, url, (1, 5), 2).content == b'xxx'
+    finally:
+        server.shutdown()
+
+@pytest.mark.parametrize('protocol', ['HTTP/1.0', 'HTTP/1.1'])
+def test_stalled_body_is_cut_off_at_the_deadline(session, protocol):
+    # Headers arrive most of the way to the deadline, then the body stalls
+    server, url = serve(0.6, 5, protocol=protocol)
+    try:
+        start = time.monotonic()
+
+        with pytest.raises(DeadlineExceeded):
+            http_client.fetch(session, url, (1, 10), 1)
+
+        assert time.monotonic() - start < 1.3
+    finally:
+        server.shutdown()
+
+def test_trickled_body_is_cut_off_at_the_deadline(session):
+    server, url = serve(0, 0.4, pieces=10)
+    try:
+        start = time.monotonic()
+
+        with pytest.raises(DeadlineExceeded):
+            http_client.fetch(session, url, (1, 10), 1)
+
+        assert time.monotonic() - start < 1.3
+    finally:
+        server.shutdown()
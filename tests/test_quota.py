@@ -0,0 +1,84 @@
+import pytest
+
+import http_client
+
+from quota import QuotaBudget, QuotaExceeded
+from resilience import CircuitOpenError, get_breaker
+from shared_cache import SharedCache
+
+def test_spend_rejects_once_the_day_cap_is_reached():
+    budget = QuotaBudget('test', per_minute=10, per_day=3)
+
+    for _ in range(3):
+        budget.spend('onecall')
+
+    with pytest.raises(QuotaExceeded):
+        budget.spend('onecall')
+
+    assert budget.calls['onecall'] == 3
+    assert budget.rejected['onecall'] == 1
+
+def test_rejected_call_takes_no_token_from_either_bucket():
+    budget = QuotaBudget('test', per_minute=10, per_day=3)
+
+    for _ in range(5):
+        try:
+            budget.spend('onecall')
+        except QuotaExceeded:
+            pass
+
+    assert budget.buckets['minute'].refill() == pytest.approx(7, abs=0.01)
+
+def test_shared_buckets_take_all_or_nothing(tmp_path):
+    shared = SharedCache(str(tmp_path / 'cache.sqlite3'))
+    budget = QuotaBudget('test', per_minute=10, per_day=3, shared=shared)
+
+    for _ in range(5):
+        try:
+            budget.spend('onecall')
+        except QuotaExceeded:
+            pass
+
+    assert budget.calls['onecall'] == 3
+    assert budget.levels['minute'] == pytest.approx(0.7, abs=0.01)
+
+@pytest.fixture
+def upstream(monkeypatch):
+    budget = QuotaBudget('test', per_minute=10, per_day=100)
+    monkeypatch.setitem(http_client.UPSTREAMS, 'test', 'http://127.0.0.1:9')
+    monkeypatch.setitem(http_client.BUDGETS, 'test', budget)
+
+    breaker = get_breaker('test')
+    breaker.success()
+    breaker.cooldown = 60
+
+    yield budget, breaker
+
+    breaker.success()
+
+def test_open_circuit_costs_no_quota(upstream):
+    budget, breaker = upstream
+
+    for _ in range(breaker.threshold):
+        breaker.failure()
+
+    for _ in range(10):
+        with pytest.raises(CircuitOpenError):
+            http_client.get('test', '/')
+
+    assert sum(budget.calls.values()) == 0
+    assert budget.buckets['minute'].refill() == pytest.approx(10, abs=0.01)
+
+def test_quota_rejection_gives_back_the_half_open_trial(upstream):
+    budget, breaker = upstream
+
+    for _ in range(breaker.threshold):
+        breaker.failure()
+
+    breaker.cooldown = 0
+    budget.buckets['minute'].rate = budget.buckets['minute'].tokens = 0
+
+    with pytest.raises(QuotaExceeded):
+        http_client.get('test', '/')
+
+    assert breaker.allow()
@@ -0,0 +1,53 @@
+import time
+
+from resilience import CircuitBreaker
+
+def test_opens_after_threshold_failures():
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+
+    for _ in range(2):
+        breaker.failure()
+
+    assert breaker.allow()
+
+    breaker.failure()
+
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+
+    assert breaker.state == 'closed'
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.success()
+
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(threshold=5, cooldown=0.05)
+
+    for _ in range(5):
+        breaker.failure()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.failure()
+
+    assert breaker.state == 'open'
+    assert not breaker.allow()
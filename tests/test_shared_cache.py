@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+import shared_cache
+
+from shared_cache import SharedCache, get_shared_cache
+
+def test_cache_directory_is_created_private(tmp_path):
+    path = tmp_path / 'weather-widget' / 'cache.sqlite3'
+    cache = SharedCache(str(path))
+    cache.set('onecall', (39.76, -84.19), {'temp': 280}, 60)
+
+    assert os.stat(path.parent).st_mode & 0o777 == 0o700
+    assert cache.get('onecall', (39.76, -84.19))[0] == {'temp': 280}
+
+def test_writable_by_others_is_refused(tmp_path):
+    os.chmod(tmp_path, 0o1777)
+
+    with pytest.raises(PermissionError):
+        SharedCache(str(tmp_path / 'cache.sqlite3'))
+
+    private = tmp_path / 'private'
+    private.mkdir(mode=0o700)
+    (private / 'cache.sqlite3').touch(mode=0o666)
+    os.chmod(private / 'cache.sqlite3', 0o666)
+
+    with pytest.raises(PermissionError):
+        SharedCache(str(private / 'cache.sqlite3'))
+
+def test_refused_file_falls_back_to_per_process_caching(tmp_path, monkeypatch):
+    os.chmod(tmp_path, 0o777)
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_PATH', str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(shared_cache, '_SHARED', None)
+    monkeypatch.setattr(shared_cache, '_SHARED_OPENED', False)
+
+    assert get_shared_cache() is None
+    assert not (tmp_path / 'cache.sqlite3').exists()
@@ -0,0 +1,32 @@
+import os
+import time
+
+from tile_proxy import Tile, TileCache
+
+def save_tiles(cache, count, size=1000):
+    for y in range(count):
+        cache.save(('precipitation', 11, 0, y), Tile(b'x'*size, time.time()))
+
+def test_prune_keeps_newest_tiles_within_max_bytes(tmp_path):
+    cache = TileCache('key', str(tmp_path), max_bytes=5000)
+    save_tiles(cache, 10)
+
+    for y in range(10):
+        os.utime(cache.path(('precipitation', 11, 0, y)), (time.time() - 100 + y,)*2)
+
+    cache.prune()
+
+    kept = [y for y in range(10) if os.path.exists(cache.path(('precipitation', 11, 0, y)))]
+    assert kept == [5, 6, 7, 8, 9]
+    assert not os.path.exists(cache.path(('precipitation', 11, 0, 0)) + '.json')
+
+def test_prune_removes_tiles_past_max_age(tmp_path):
+    cache = TileCache('key', str(tmp_path), max_age=60)
+    save_tiles(cache, 2)
+    old = cache.path(('precipitation', 11, 0, 0))
+    os.utime(old, (time.time() - 120,)*2)
+
+    cache.prune()
+
+    assert not os.path.exists(old)
+    assert os.path.exists(cache.path(('precipitation', 11, 0, 1)))